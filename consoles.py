@@ -4,7 +4,8 @@
 consoles.py: bring up a bunch of miniature consoles on a virtual network
 
 This demo shows how to monitor a set of nodes by using
-Node's monitor() and Tkinter's createfilehandler().
+Node's monitor() from a single epoll thread, whose output
+Tkinter picks up in batches.
 
 We monitor nodes in a couple of ways:
 
@@ -24,11 +25,25 @@ The consoles also support limited interaction:
 Bob Lantz, April 2010
 
 """
+import os
+import sys
 import time
 import re
-import commands
-
-from Tkinter import Frame, Button, Label, Text, Scrollbar, Canvas, Wm, READABLE
+import heapq
+import json
+import fcntl
+import random
+import select
+import signal
+import threading
+from argparse import ArgumentParser
+from array import array
+from cmd import Cmd
+from collections import deque
+from multiprocessing.pool import ThreadPool
+from subprocess import Popen, STDOUT
+
+from Tkinter import Frame, Button, Label, Text, Scrollbar, Canvas, Wm
 
 from mininet.log import setLogLevel
 from mininet.topolib import TreeNet
@@ -36,6 +51,7 @@ from mininet.term import makeTerms, cleanUpScreens
 from mininet.util import quietRun
 from mininet.node import Node
 from mininet.topo import Topo
+from mininet.link import TCLink
 from mininet.net import Mininet
 
 servers = 0
@@ -46,6 +62,63 @@ start = 1
 number = 0
 watch = 0
 local_program_path = "/usr/local/sbin"
+vlan_test_path = "/etc/vlan_test"
+
+# daemons started at once, launches per second, seconds to wait for a pidfile
+launch_concurrency = 20
+launch_rate = 20.0
+launch_timeout = 30.0
+# seconds after 'vlan stop' until SIGTERM, and until SIGKILL, when
+# stopping daemons
+stop_grace = 1.0
+stop_timeout = 5.0
+# lines kept by each console, milliseconds between console redraws
+console_scrollback = 500
+console_flush_ms = 50
+# milliseconds between batches of host output handed to the consoles
+drain_ms = 50
+# rows of consoles in view at once
+console_rows = 4
+# milliseconds between refreshes of the status board
+status_refresh_ms = 1000
+# milliseconds between aggregate bandwidth bars
+iperf_interval_ms = 1000
+# values kept by each graph, and an optional CSV file the bandwidth
+# graph appends every value to
+graph_history = 86400
+graph_csv = None
+# milliseconds between resource samples of the daemons, and an optional
+# file every sample is logged to (CSV, or JSON lines for *.json)
+sample_interval_ms = 2000
+resource_log = None
+# milliseconds between reads of the daemon logs, and an optional file
+# the log line counts of every interval are written to as JSON lines
+log_interval_ms = 1000
+event_log = None
+# how the hosts are switched: 'single', 'tree' or 'leafspine', children
+# per switch, spines, and TCLink options for host and switch links
+topo_layout = 'single'
+topo_fanout = 16
+topo_spines = 2
+host_link = {}
+switch_link = {}
+# threads creating or stopping nodes and links at once
+bringup_workers = 32
+# first overlay address, hosts probing at once, seconds between the
+# probes of a host, and where the convergence results are saved
+overlay_base = '10.1.0.0'
+probe_concurrency = 20
+probe_interval_ms = 1000
+probe_results = 'mesh_probe.json'
+# traffic pattern, pairs of the 'pairs' pattern, seconds of traffic,
+# parallel streams per client, seconds between client starts, and
+# where the traffic results are saved
+traffic_pattern = 'ring'
+traffic_pairs = 10
+traffic_duration = 10
+traffic_streams = 1
+traffic_stagger = 0.1
+traffic_results = 'traffic.json'
 
 global start_how_many
 start_how_many = 1
@@ -56,24 +129,97 @@ class MyNode(Node):
         Node.__init__(self)
 
 
-class MyTopo(Topo):
-    "Simple topology example."
+def hostMac(i):
+    "Return the MAC address of host i."
+    return ':'.join('%02x' % (i >> shift & 0xff) for shift in range(40, -8, -8))
 
-    def __init__(self):
-        "Create custom topo."
 
-        # Initialize topology
-        Topo.__init__(self)
+def hostIp(i):
+    "Return the address of host i in Mininet's default 10.0.0.0/8."
+    return '10.%d.%d.%d/8' % (i >> 16 & 0xff, i >> 8 & 0xff, i & 0xff)
 
-        # Add hosts and switches
-        s1 = self.addSwitch('s1')
-        for i in range(1, servers + clients + 1):
-            mac = hex(i).replace('0x', '')
-            mac = '0' * (12 - len(mac)) + mac
-            for j in range(5, 0, -1):
-                mac = mac[0: j * 2] + ':' + mac[j * 2: len(mac)]
-            exec ("vland_" + str(i) + "= self.addHost('vland_" + str(i) + "', mac='" + mac + "')")
-            exec ("self.addLink(s1" + ", vland_" + str(i) + ")")
+
+def parseLinkOpts(text):
+    "Return TCLink options from text such as 'bw=100,delay=5ms,loss=1'."
+    opts = {}
+    if not text:
+        return opts
+    for item in text.split(','):
+        key, value = item.split('=', 1)
+        key = key.strip()
+        if key in ('bw', 'loss'):
+            opts[key] = float(value)
+        elif key == 'max_queue_size':
+            opts[key] = int(value)
+        elif key in ('delay', 'jitter'):
+            opts[key] = value.strip()
+        else:
+            raise ValueError('unknown link option: ' + key)
+    return opts
+
+
+class MyTopo(Topo):
+    """The hosts vland_1 to vland_N on one switch, on a tree of switches
+       with at most topo_fanout children each, or on a leaf-spine fabric
+       of topo_spines spines and leaves of topo_fanout hosts. The first
+       switch added is the root or a spine, where the NAT attaches.
+       Links get host_link or switch_link TCLink options when set."""
+
+    def build(self):
+        hosts = [self.addHost('vland_%d' % i, mac=hostMac(i), ip=hostIp(i))
+                 for i in range(1, servers + clients + 1)]
+        if topo_layout == 'single':
+            edges = [self.addSwitch('s1')]
+            perEdge = max(1, len(hosts))
+        elif topo_layout == 'tree':
+            edges = self.buildTree(len(hosts))
+            perEdge = topo_fanout
+        elif topo_layout == 'leafspine':
+            edges = self.buildLeafSpine(len(hosts))
+            perEdge = topo_fanout
+        else:
+            raise ValueError('unknown topology layout: ' + topo_layout)
+        for k, host in enumerate(hosts):
+            self.link(edges[k // perEdge], host, host_link)
+
+    def buildTree(self, nhosts):
+        "Add the switches of a tree, return its edge switches."
+        sizes = [max(1, (nhosts + topo_fanout - 1) // topo_fanout)]
+        while sizes[-1] > 1:
+            sizes.append((sizes[-1] + topo_fanout - 1) // topo_fanout)
+        sizes.reverse()
+        count = 0
+        parents = []
+        for size in sizes:
+            level = []
+            for j in range(size):
+                count += 1
+                level.append(self.addSwitch('s%d' % count))
+                if parents:
+                    self.link(parents[j // topo_fanout], level[-1], switch_link)
+            parents = level
+        return parents
+
+    def buildLeafSpine(self, nhosts):
+        """Add spines and leaves, every leaf linked to every spine.
+           The fabric has loops, so its switches run STP standalone."""
+        opts = {'failMode': 'standalone', 'stp': True}
+        spines = [self.addSwitch('s%d' % (j + 1), **opts)
+                  for j in range(topo_spines)]
+        leaves = []
+        for j in range(max(1, (nhosts + topo_fanout - 1) // topo_fanout)):
+            leaf = self.addSwitch('s%d' % (topo_spines + j + 1), **opts)
+            for spine in spines:
+                self.link(spine, leaf, switch_link)
+            leaves.append(leaf)
+        return leaves
+
+    def link(self, node1, node2, opts):
+        "Add a link, shaped by TCLink if opts has any options."
+        if opts:
+            self.addLink(node1, node2, cls=TCLink, **opts)
+        else:
+            self.addLink(node1, node2)
 
 
 topos = {'mytopo': (lambda: MyTopo())}
@@ -82,13 +228,18 @@ topos = {'mytopo': (lambda: MyTopo())}
 class Console(Frame):
     "A simple console on a host."
 
-    def __init__(self, parent, net, node, height=10, width=32, title='Node'):
+    def __init__(self, parent, net, node, height=10, width=32, title='Node',
+                 scrollback=console_scrollback, send=None):
         Frame.__init__(self, parent)
 
         self.net = net
         self.node = node
         self.prompt = node.name + '# '
         self.height, self.width, self.title = height, width, title
+        self.scrollback = scrollback
+        self.send = send
+        self.pending = []
+        self.flushScheduled = False
 
         # Initialize widget styles
         self.buttonStyle = {'font': 'Monaco 14'}
@@ -108,19 +259,16 @@ class Console(Frame):
         # Set up widgets
         self.text = self.makeWidgets()
         self.bindEvents()
-        self.sendCmd('export TERM=dumb')
-
-        self.outputHook = None
 
     def makeWidgets(self):
         "Make a label, a text area, and a scroll bar."
 
-        def newTerm(net=self.net, node=self.node, title=self.title):
-            "Pop up a new terminal window for a node."
-            net.terms += makeTerms([node], title)
+        def newTerm():
+            "Pop up a new terminal window for our node."
+            self.net.terms += makeTerms([self.node], self.title)
 
-        label = Button(self, text=self.node.name, command=newTerm,
-                       **self.buttonStyle)
+        label = self.label = Button(self, text=self.node.name, command=newTerm,
+                                    **self.buttonStyle)
         label.pack(side='top', fill='x')
         text = Text(self, wrap='word', **self.textStyle)
         ybar = Scrollbar(self, orient='vertical', width=7,
@@ -131,7 +279,7 @@ class Console(Frame):
         return text
 
     def bindEvents(self):
-        "Bind keyboard and file events."
+        "Bind keyboard events."
         # The text widget handles regular key presses, but we
         # use special handlers for the following:
         self.text.bind('<Control-c>', self.handlec)
@@ -140,26 +288,46 @@ class Console(Frame):
         self.text.bind('<Control-d>', self.handleInt)
         self.text.bind('<KeyPress>', self.handleKey)
 
-        # This is not well-documented, but it is the correct
-        # way to trigger a file event handler from Tk's
-        # event loop!
-        self.tk.createfilehandler(self.node.stdout, READABLE,
-                                  self.handleReadable)
+        # Node output is read by the application's OutputMux,
+        # which hands it to append()
 
     # We're not a terminal (yet?), so we ignore the following
     # control characters other than [\b\n\r]
     ignoreChars = re.compile(r'[\x00-\x07\x09\x0b\x0c\x0e-\x1f]+')
 
     def append(self, text):
-        "Append something to our text frame."
-        text = self.ignoreChars.sub('', text)
+        "Append cleaned up output to our text frame at the next redraw."
+        self.pending.append(text)
+        if not self.flushScheduled:
+            self.flushScheduled = True
+            self.after(console_flush_ms, self.flush)
+
+    def attach(self, node, text=''):
+        "Show node in this console, starting from its buffered output."
+        self.node = node
+        self.prompt = node.name + '# '
+        self.label.configure(text=node.name)
+        del self.pending[:]
+        self.text.delete('1.0', 'end')
+        self.text.insert('end', text)
+        self.text.mark_set('insert', 'end')
+        self.text.see('insert')
+
+    def flush(self):
+        "Insert the pending output in one go and trim old lines."
+        self.flushScheduled = False
+        if not self.pending:
+            return
+        text = ''.join(self.pending)
+        del self.pending[:]
+        if text.count('\n') > self.scrollback:
+            text = '\n'.join(text.split('\n')[-self.scrollback:])
         self.text.insert('end', text)
+        lines = int(self.text.index('end-1c').split('.')[0])
+        if lines > self.scrollback:
+            self.text.delete('1.0', '%d.0' % (lines - self.scrollback + 1))
         self.text.mark_set('insert', 'end')
         self.text.see('insert')
-        outputHook = lambda x, y: True  # make pylint happier
-        if self.outputHook:
-            outputHook = self.outputHook
-        outputHook(self, text)
 
     def handlec(self, event):
         if self.node.waiting:
@@ -194,18 +362,12 @@ class Console(Frame):
         self.node.sendInt()
 
     def sendCmd(self, cmd):
-        "Send a command to our node."
-        if not self.node.waiting:
+        "Send a command to our node, through send(node, cmd) if we have it."
+        if self.send is not None:
+            self.send(self.node, cmd)
+        elif not self.node.waiting:
             self.node.sendCmd(cmd)
 
-    def handleReadable(self, _fds, timeoutms=None):
-        "Handle file readable event."
-        data = self.node.monitor(timeoutms)
-        self.append(data)
-        if not self.node.waiting:
-            # Print prompt
-            self.append(self.prompt)
-
     def waiting(self):
         "Are we waiting for output?"
         return self.node.waiting
@@ -213,20 +375,181 @@ class Console(Frame):
     def waitOutput(self):
         "Wait for any remaining output."
         while self.node.waiting:
-            # A bit of a trade-off here...
-            self.handleReadable(self, timeoutms=1000)
+            # Output keeps arriving through the application's drain loop
             self.update()
+            time.sleep(0.01)
 
     def clear(self):
         "Clear all of our text."
+        del self.pending[:]
         self.text.delete('1.0', 'end')
 
 
+class OutputBuffer(object):
+    "The last lines of output of a node, kept whether or not a console shows it."
+
+    def __init__(self, limit=console_scrollback):
+        self.lines = deque(maxlen=limit)
+        self.partial = ''
+
+    def append(self, text):
+        lines = (self.partial + text).split('\n')
+        self.partial = lines.pop()
+        self.lines.extend(lines)
+
+    def text(self):
+        if not self.lines:
+            return self.partial
+        return '\n'.join(self.lines) + '\n' + self.partial
+
+    def clear(self):
+        self.lines.clear()
+        self.partial = ''
+
+
+class ConsoleGrid(Frame):
+    """A scrollable grid of consoles that only has widgets for the rows
+       in view. Scrolling attaches the same Console widgets to other
+       nodes, which show the nodes' buffered output."""
+
+    def __init__(self, parent, net, nodes, buffers, width=4, rows=console_rows,
+                 title='Node', send=None):
+        Frame.__init__(self, parent)
+        self.net = net
+        self.nodes = nodes
+        self.buffers = buffers
+        self.width = width
+        self.rows = rows
+        self.first = None
+        self.visible = {}
+
+        grid = Frame(self)
+        self.consoles = []
+        for index in range(min(len(nodes), width * rows)):
+            console = Console(grid, net, nodes[index], title=title, send=send)
+            console.grid(row=index // width, column=index % width, sticky='nsew')
+            self.consoles.append(console)
+        for row in range(rows):
+            grid.rowconfigure(row, weight=1)
+        for column in range(width):
+            grid.columnconfigure(column, weight=1)
+        self.ybar = Scrollbar(self, orient='vertical', command=self.yview)
+        self.ybar.pack(side='right', fill='y')
+        grid.pack(side='left', expand=True, fill='both')
+        for widget in (self, grid, self.ybar):
+            widget.bind('<Button-4>', lambda _event: self.yview('scroll', -1, 'units'))
+            widget.bind('<Button-5>', lambda _event: self.yview('scroll', 1, 'units'))
+        self.show(0)
+
+    def totalRows(self):
+        return (len(self.nodes) + self.width - 1) // self.width
+
+    def yview(self, *args):
+        "Scroll by scroll bar command."
+        if args[0] == 'moveto':
+            row = int(round(float(args[1]) * self.totalRows()))
+        else:
+            row = int(args[1])
+            if args[2] == 'pages':
+                row *= self.rows
+            row += self.first
+        self.show(row)
+
+    def show(self, row):
+        "Attach the consoles to the nodes from row on."
+        row = max(0, min(row, self.totalRows() - self.rows))
+        if row == self.first:
+            return
+        self.first = row
+        self.visible = {}
+        for k, console in enumerate(self.consoles):
+            index = row * self.width + k
+            if index < len(self.nodes):
+                node = self.nodes[index]
+                console.attach(node, self.buffers[node].text())
+                console.grid()
+                self.visible[node] = console
+            else:
+                console.grid_remove()
+        total = float(max(self.totalRows(), 1))
+        self.ybar.set(row / total, min(1.0, (row + self.rows) / total))
+
+    def clear(self):
+        "Clear the output of every node in the grid."
+        for node in self.nodes:
+            self.buffers[node].clear()
+        for console in self.consoles:
+            console.clear()
+
+
+class StatusBoard(Frame):
+    """A table with one line per host, rebuilt from app.statusTable()
+       in a single pass on a timer while the board is on screen."""
+
+    def __init__(self, parent, app, interval=status_refresh_ms):
+        Frame.__init__(self, parent)
+        self.app = app
+        self.interval = interval
+        self.header = Label(self, font='Monaco 12 bold', anchor='w',
+                            text=statusHeader)
+        self.text = Text(self, wrap='none', font='Monaco 12', bg='black',
+                         fg='green', height=40, width=120, state='disabled')
+        ybar = Scrollbar(self, orient='vertical', command=self.text.yview)
+        self.text.configure(yscrollcommand=ybar.set)
+        self.header.pack(side='top', fill='x')
+        ybar.pack(side='right', fill='y')
+        self.text.pack(side='left', expand=True, fill='both')
+        self.refresh()
+
+    def refresh(self):
+        "Redraw the table if it is on screen."
+        if self.winfo_ismapped():
+            top = self.text.yview()[0]
+            self.text.configure(state='normal')
+            self.text.delete('1.0', 'end')
+            self.text.insert('end', '\n'.join(self.app.statusTable()))
+            self.text.yview('moveto', top)
+            self.text.configure(state='disabled')
+        self.after(self.interval, self.refresh)
+
+    def clear(self):
+        "Nothing to clear; the table is rebuilt on every refresh."
+        pass
+
+
+class GraphLog(object):
+    "Graph bars appended to a CSV file, one index,time,value row per bar."
+
+    fields = ('index', 'time', 'value')
+
+    def __init__(self, path):
+        empty = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.f = open(path, 'a')
+        if empty:
+            self.f.write(','.join(self.fields) + '\n')
+
+    @staticmethod
+    def row(index, when, value):
+        "Return the CSV row of a bar."
+        return '%d,%.3f,%g\n' % (index, when, value)
+
+    def write(self, index, when, value):
+        self.f.write(self.row(index, when, value))
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
 class Graph(Frame):
-    "Graph that we can add bars to over time."
+    """Graph that we can add bars to over time. The values live in a
+       fixed size ring buffer, and the canvas has one pair of items per
+       column that is reused on every redraw. Zoomed out, a column
+       covers several values and shows their minimum and maximum."""
 
     def __init__(self, parent=None, bg='white', gheight=200, gwidth=500,
-                 barwidth=10, ymax=3.5, ):
+                 barwidth=10, ymax=3.5, title='Bandwidth (Gb/s)',
+                 history=graph_history, csvPath=None):
 
         Frame.__init__(self, parent)
         self.bg = bg
@@ -234,12 +557,23 @@ class Graph(Frame):
         self.gwidth = gwidth
         self.barwidth = barwidth
         self.ymax = float(ymax)
-        self.xpos = 0
+        self.history = history
+        self.values = array('d', [0.0]) * history
+        self.times = array('d', [0.0]) * history
+        self.count = 0
+        # values per column, and columns between the newest value and
+        # the right edge (0 follows new values)
+        self.zoom = 1
+        self.offset = 0
+        self.columns = []
+        self.redrawScheduled = False
+        self.csv = None
+        if csvPath is not None:
+            self.csv = GraphLog(csvPath)
 
         # Create everything
-        self.title, self.scale, self.graph = self.createWidgets()
-        self.updateScrollRegions()
-        self.yview('moveto', '1.0')
+        self.title, self.scale, self.graph, self.xbar = self.createWidgets(title)
+        self.redraw()
 
     def createScale(self):
         "Create a and return a new canvas with scale markers."
@@ -252,73 +586,147 @@ class Graph(Frame):
         # Draw scale line
         scale.create_line(width - 1, height, width - 1, 0, **opts)
         # Draw ticks and numbers
-        for y in range(0, int(ymax + 1)):
+        step = max(1, int(ymax // 10))
+        for y in range(0, int(ymax + 1), step):
             ypos = height * (1 - float(y) / ymax)
             scale.create_line(width, ypos, width - 10, ypos, **opts)
             scale.create_text(10, ypos, text=str(y), **opts)
         return scale
 
-    def updateScrollRegions(self):
-        "Update graph and scale scroll regions."
-        ofs = 20
-        height = self.gheight + ofs
-        self.graph.configure(scrollregion=(0, -ofs,
-                                           self.xpos * self.barwidth, height))
-        self.scale.configure(scrollregion=(0, -ofs, 0, height))
-
-    def yview(self, *args):
-        "Scroll both scale and graph."
-        self.graph.yview(*args)
-        self.scale.yview(*args)
-
-    def createWidgets(self):
+    def createWidgets(self, text):
         "Create initial widget set."
 
         # Objects
-        title = Label(self, text='Bandwidth (Gb/s)', bg=self.bg)
+        title = Label(self, text=text, bg=self.bg)
         width = self.gwidth
         height = self.gheight
         scale = self.createScale()
         graph = Canvas(self, width=width, height=height, background=self.bg)
-        xbar = Scrollbar(self, orient='horizontal', command=graph.xview)
-        ybar = Scrollbar(self, orient='vertical', command=self.yview)
-        graph.configure(xscrollcommand=xbar.set, yscrollcommand=ybar.set,
-                        scrollregion=(0, 0, width, height))
-        scale.configure(yscrollcommand=ybar.set)
+        xbar = Scrollbar(self, orient='horizontal', command=self.xview)
+        buttons = Frame(self, bg=self.bg)
+        for name, cmd in (('-', lambda: self.setZoom(self.zoom * 2)),
+                          ('+', lambda: self.setZoom(self.zoom // 2)),
+                          ('CSV', self.exportCsv)):
+            Button(buttons, text=name, command=cmd).pack(side='left')
 
         # Layout
-        title.grid(row=0, columnspan=3, sticky='new')
+        title.grid(row=0, column=0, columnspan=2, sticky='new')
+        buttons.grid(row=0, column=2, sticky='ne')
         scale.grid(row=1, column=0, sticky='nsew')
-        graph.grid(row=1, column=1, sticky='nsew')
-        ybar.grid(row=1, column=2, sticky='ns')
-        xbar.grid(row=2, column=0, columnspan=2, sticky='ew')
+        graph.grid(row=1, column=1, columnspan=2, sticky='nsew')
+        xbar.grid(row=2, column=0, columnspan=3, sticky='ew')
         self.rowconfigure(1, weight=1)
         self.columnconfigure(1, weight=1)
-        return title, scale, graph
+        graph.bind('<Configure>', lambda _event: self.scheduleRedraw())
+        return title, scale, graph, xbar
 
-    def addBar(self, yval):
+    def addBar(self, yval, when=None):
         "Add a new bar to our graph."
-        percent = yval / self.ymax
+        if when is None:
+            when = time.time()
+        slot = self.count % self.history
+        self.values[slot] = yval
+        self.times[slot] = when
+        self.count += 1
+        if self.csv is not None:
+            self.csv.write(self.count - 1, when, yval)
+        self.scheduleRedraw()
+
+    def first(self):
+        "Index of the oldest value still kept."
+        return max(0, self.count - self.history)
+
+    def window(self, lo, hi):
+        "Return the values with indices lo to hi (exclusive)."
+        a, b = lo % self.history, hi % self.history
+        if hi - lo <= 0:
+            return []
+        if a < b:
+            return self.values[a:b]
+        return self.values[a:] + self.values[:b]
+
+    def scheduleRedraw(self):
+        "Redraw once when Tk is idle, however many values came in."
+        if not self.redrawScheduled:
+            self.redrawScheduled = True
+            self.after_idle(self.redraw)
+
+    def redraw(self):
+        "Draw the columns in view, reusing the canvas items."
+        self.redrawScheduled = False
         c = self.graph
-        x0 = self.xpos * self.barwidth
-        x1 = x0 + self.barwidth
-        y0 = self.gheight
-        y1 = (1 - percent) * self.gheight
-        c.create_rectangle(x0, y0, x1, y1, fill='green')
-        self.xpos += 1
-        self.updateScrollRegions()
-        self.graph.xview('moveto', '1.0')
+        width = c.winfo_width()
+        if width <= 1:
+            width = self.gwidth
+        ncolumns = max(1, width // self.barwidth)
+        while len(self.columns) < ncolumns:
+            self.columns.append((c.create_rectangle(0, 0, 0, 0, fill='pale green', width=0),
+                                 c.create_rectangle(0, 0, 0, 0, fill='green', width=0)))
+        end = self.count - self.offset * self.zoom
+        for k, (high, low) in enumerate(self.columns):
+            hi = end - (ncolumns - 1 - k) * self.zoom
+            values = self.window(max(self.first(), hi - self.zoom), hi)
+            if k >= ncolumns or not values:
+                c.coords(high, 0, 0, 0, 0)
+                c.coords(low, 0, 0, 0, 0)
+                continue
+            x0 = k * self.barwidth
+            x1 = x0 + self.barwidth - 1
+            c.coords(high, x0, self.ypos(max(values)), x1, self.gheight)
+            c.coords(low, x0, self.ypos(min(values)), x1, self.gheight)
+        kept = float(max(1, self.count - self.first()))
+        shown = ncolumns * self.zoom
+        right = max(0, end - self.first()) / kept
+        self.xbar.set(max(0.0, right - shown / kept), min(1.0, right))
+
+    def ypos(self, yval):
+        "Return the canvas y of yval, clipped to the graph."
+        return (1 - min(max(yval / self.ymax, 0), 1)) * self.gheight
+
+    def xview(self, *args):
+        "Pan by scroll bar command."
+        ncolumns = max(1, len(self.columns))
+        total = max(0, (self.count - self.first()) // self.zoom - ncolumns)
+        if args[0] == 'moveto':
+            offset = total - int(float(args[1]) * (total + ncolumns))
+        else:
+            step = int(args[1])
+            if args[2] == 'pages':
+                step *= ncolumns
+            offset = self.offset - step
+        self.offset = max(0, min(offset, total))
+        self.scheduleRedraw()
+
+    def setZoom(self, zoom):
+        "Show zoom values per column."
+        self.zoom = max(1, min(zoom, max(1, self.history // max(1, len(self.columns)))))
+        self.offset = 0
+        self.scheduleRedraw()
+
+    def exportCsv(self, path=None):
+        "Write every value kept to path, a timestamped file by default."
+        if path is None:
+            path = 'graph-%d.csv' % time.time()
+        f = open(path, 'w')
+        f.write(','.join(GraphLog.fields) + '\n')
+        for i in range(self.first(), self.count):
+            slot = i % self.history
+            f.write(GraphLog.row(i, self.times[slot], self.values[slot]))
+        f.close()
+        print('graph written to ' + path)
+        return path
 
     def clear(self):
         "Clear graph contents."
-        self.graph.delete('all')
-        self.xpos = 0
+        self.count = 0
+        self.offset = 0
+        self.scheduleRedraw()
 
     def test(self):
         "Add a bar for testing purposes."
         ms = 1000
-        if self.xpos < 10:
-            self.addBar(self.xpos / 10 * self.ymax)
+        if self.count < 10:
+            self.addBar(self.count / 10.0 * self.ymax)
             self.after(ms, self.test)
 
     def setTitle(self, text):
@@ -326,12 +734,1372 @@ class Graph(Frame):
         self.title.configure(text=text, font='Helvetica 9 bold')
 
 
-class ConsoleApp(Frame):
+def daemonCommand(i, watching=False):
+    "Return the shell command that starts the daemon of host i."
+    str_i = vlan_test_path + '/' + str(i)
+    if watching:
+        return ('nohup ' + local_program_path + '/vlan -c ' + str_i +
+                ' --pidfile=' + str_i + '/vlan.pid watch --logfile=' + str_i +
+                '/vlan.log -d 1 > /dev/null  2>&1 &')
+    return ('nohup ' + local_program_path + '/vland -c ' + str_i +
+            ' --pidfile=' + str_i + '/vlan.pid --logfile=' + str_i +
+            '/vlan.log -d 1 > /dev/null  2>&1 &')
+
+
+def stopCommand(i):
+    "Return the command that asks the daemon of host i to stop."
+    str_i = vlan_test_path + '/' + str(i)
+    return [local_program_path + '/vlan', '-c', str_i,
+            '--pidfile=' + str_i + '/vlan.pid', 'stop']
+
+
+def pidfile(i):
+    "Return the pidfile path of host i."
+    return vlan_test_path + '/' + str(i) + '/vlan.pid'
+
+
+def readPid(i):
+    "Return the pid in the pidfile of host i, or None."
+    try:
+        f = open(pidfile(i))
+        data = f.read().split()
+        f.close()
+        return int(data[0])
+    except (IOError, IndexError, ValueError):
+        return None
+
+
+def daemonKind(pid, i):
+    """Return 'vland' or 'watch' if process pid is the daemon of host i,
+       going by its command line, or None for a process that is not,
+       such as one that reuses the pid of a daemon that is gone."""
+    try:
+        args = readProc(pid, 'cmdline').split('\0')
+    except IOError:
+        return None
+    # The program may be run through an interpreter
+    if not [arg for arg in args[:2] if os.path.basename(arg) in ('vland', 'vlan')]:
+        return None
+    directory = vlan_test_path + '/' + str(i)
+    for k, arg in enumerate(args[:-1]):
+        if arg == '-c' and args[k + 1].rstrip('/') == directory:
+            return 'watch' if 'watch' in args else 'vland'
+    return None
+
+
+def pidAlive(pid):
+    "Does process pid exist, and is it more than a zombie?"
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    try:
+        f = open('/proc/%d/stat' % pid)
+        stat = f.read()
+        f.close()
+    except IOError:
+        return False
+    return stat[stat.rfind(')') + 2:][:1] != 'Z'
+
+
+clockTicks = os.sysconf('SC_CLK_TCK')
+pageSize = os.sysconf('SC_PAGE_SIZE')
+
+
+def readProc(pid, name):
+    "Return the contents of /proc/pid/name."
+    f = open('/proc/%d/%s' % (pid, name))
+    data = f.read()
+    f.close()
+    return data
+
+
+class ProcSampler(object):
+    """CPU and memory use of processes, read from /proc/<pid>/stat.
+       CPU% is the share of one CPU used since the previous sample.
+       Samples with detail also read status and io, for the context
+       switch and I/O rates per second since the previous sample."""
+
+    def __init__(self):
+        self.last = {}
+
+    def sample(self, pids, detail=False):
+        """Return Object(state, cpu, rss, uptime, vctxt, nvctxt, read, write)
+           by pid for the pids that exist. Rates are None on a first sample
+           and without detail."""
+        now = time.time()
+        f = open('/proc/uptime')
+        uptime = float(f.read().split()[0])
+        f.close()
+        samples = {}
+        last = {}
+        for pid in pids:
+            try:
+                stat = readProc(pid, 'stat')
+            except IOError:
+                continue
+            # Fields after the command name, starting with the state
+            fields = stat[stat.rfind(')') + 2:].split()
+            counters = {'ticks': int(fields[11]) + int(fields[12])}
+            rss = int(fields[21]) * pageSize
+            if detail:
+                try:
+                    status = readProc(pid, 'status')
+                    io = readProc(pid, 'io')
+                except IOError:
+                    status = io = ''
+                for line in status.splitlines():
+                    key, _, value = line.partition(':')
+                    if key == 'VmRSS':
+                        rss = int(value.split()[0]) * 1024
+                    elif key == 'voluntary_ctxt_switches':
+                        counters['vctxt'] = int(value)
+                    elif key == 'nonvoluntary_ctxt_switches':
+                        counters['nvctxt'] = int(value)
+                # rchar and wchar count socket and tun traffic, not only disk
+                for line in io.splitlines():
+                    key, _, value = line.partition(':')
+                    if key == 'rchar':
+                        counters['read'] = int(value)
+                    elif key == 'wchar':
+                        counters['write'] = int(value)
+            rates = {}
+            if pid in self.last and now > self.last[pid][0]:
+                then, before = self.last[pid]
+                for key in counters:
+                    if key in before:
+                        rates[key] = (counters[key] - before[key]) / (now - then)
+            last[pid] = (now, counters)
+            cpu = rates.get('ticks')
+            if cpu is not None:
+                cpu = 100.0 * cpu / clockTicks
+            samples[pid] = Object(state=fields[0], cpu=cpu, rss=rss,
+                                  uptime=uptime - int(fields[19]) / float(clockTicks),
+                                  vctxt=rates.get('vctxt'), nvctxt=rates.get('nvctxt'),
+                                  read=rates.get('read'), write=rates.get('write'))
+        self.last = last
+        return samples
+
+
+class ResourceLog(object):
+    "Per-daemon resource samples appended to a CSV file, or JSON lines for *.json."
+
+    fields = ('time', 'launched', 'host', 'pid', 'cpu', 'rss',
+              'vctxt', 'nvctxt', 'read', 'write')
+
+    def __init__(self, path):
+        self.json = path.endswith('.json')
+        empty = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.f = open(path, 'a')
+        if empty and not self.json:
+            self.f.write(','.join(self.fields) + '\n')
+
+    def write(self, records):
+        for record in records:
+            if self.json:
+                self.f.write(json.dumps(record, sort_keys=True) + '\n')
+            else:
+                self.f.write(','.join('' if record[key] is None else str(record[key])
+                                      for key in self.fields) + '\n')
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+def summarizeResources(records):
+    """Return Object(daemons, cpu, rss, ctxt, read, write): the mean CPU%
+       and RSS per daemon, and the summed rates of every daemon."""
+
+    def total(key):
+        values = [r[key] for r in records if r[key] is not None]
+        return sum(values) if values else None
+
+    n = len(records)
+    cpu, rss = total('cpu'), total('rss')
+    ctxt = None
+    if total('vctxt') is not None:
+        ctxt = total('vctxt') + (total('nvctxt') or 0)
+    return Object(daemons=n, cpu=cpu / n if cpu is not None else None,
+                  rss=rss / n if rss is not None else None, ctxt=ctxt,
+                  read=total('read'), write=total('write'))
+
+
+def formatResources(summary):
+    "Return a one line description of a resource summary."
+    if summary.cpu is None:
+        return 'daemons: %d' % summary.daemons
+    return ('daemons: %d, per daemon %.1f%% cpu %.1f MB rss, '
+            'total %.0f ctxt/s, %.1f KB/s read %.1f KB/s write' %
+            (summary.daemons, summary.cpu, summary.rss / 1048576.0,
+             summary.ctxt or 0, (summary.read or 0) / 1024.0,
+             (summary.write or 0) / 1024.0))
+
+
+def logPath(i):
+    "Return the log path of host i."
+    return vlan_test_path + '/' + str(i) + '/vlan.log'
+
+
+# Kinds of daemon log lines, the first matching pattern wins
+logPatterns = [
+    ('crash', re.compile(r'\bsegfault|\bSIGSEGV\b|\bSIGABRT\b|\bcore dumped\b'
+                         r'|\babort\(\)|\bgot fatal signal\b|\bcrash(ed)?\b', re.I)),
+    ('reconnect', re.compile(r'\bre-?connect|\btrying to connect\b'
+                             r'|\bconnection\b.*\b(closed|lost|reset|aborted)\b'
+                             r'|\btimed out\b|\btimeout\b', re.I)),
+    ('error', re.compile(r'\berror\b|\bfail|\bcannot\b|\bcould not\b|\bunable\b', re.I))
+]
+logKinds = [kind for kind, _pattern in logPatterns]
+
+
+class LogTailer(object):
+    """Follow the logs of many hosts, reading only what was appended
+       since the last poll. A log that was replaced or truncated is
+       read again from its start. Lines are counted by kind per host
+       and per interval, and crash.* files are reported once each."""
+
+    def __init__(self, patterns=logPatterns):
+        self.patterns = patterns
+        self.reset()
+
+    def reset(self):
+        self.logs = {}
+        self.counts = {}
+        self.interval = dict((kind, 0) for kind in logKinds)
+        self.crashes = set()
+
+    def poll(self, indices):
+        "Read the logs of hosts indices; return the new (host, crash file)s."
+        crashes = []
+        for i in indices:
+            self.read(i)
+            directory = vlan_test_path + '/' + str(i)
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                continue
+            for name in names:
+                path = directory + '/' + name
+                if name.startswith('crash.') and path not in self.crashes:
+                    self.crashes.add(path)
+                    self.count(i, 'crash')
+                    crashes.append((i, path))
+        return crashes
+
+    def read(self, i):
+        "Read and classify what was appended to the log of host i."
+        path = logPath(i)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        log = self.logs.get(i)
+        if log is None or log.inode != st.st_ino or st.st_size < log.offset:
+            log = self.logs[i] = Object(inode=st.st_ino, offset=0, partial='',
+                                        last='')
+        if st.st_size == log.offset:
+            return
+        try:
+            f = open(path)
+        except IOError:
+            return
+        f.seek(log.offset)
+        data = f.read()
+        log.offset = f.tell()
+        f.close()
+        lines = (log.partial + data).split('\n')
+        log.partial = lines.pop()[-4096:]
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            log.last = line
+            for kind, pattern in self.patterns:
+                if pattern.search(line):
+                    self.count(i, kind)
+                    break
+
+    def count(self, i, kind):
+        counts = self.counts.setdefault(i, dict((k, 0) for k in logKinds))
+        counts[kind] += 1
+        self.interval[kind] += 1
+
+    def flush(self):
+        "Return the counts by kind since the last flush."
+        interval = self.interval
+        self.interval = dict((kind, 0) for kind in logKinds)
+        return interval
+
+    def totals(self):
+        "Return the counts by kind over every host."
+        totals = dict((kind, 0) for kind in logKinds)
+        for counts in self.counts.values():
+            for kind in counts:
+                totals[kind] += counts[kind]
+        return totals
+
+    def last(self, i):
+        "Return the last line read from the log of host i."
+        log = self.logs.get(i)
+        return log.last if log else ''
+
+
+def formatCounts(counts):
+    "Return log line counts by kind as text."
+    return ', '.join('%s %d' % (kind, counts[kind]) for kind in logKinds)
+
+
+def formatUptime(seconds):
+    "Return seconds as [h:]mm:ss."
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return '%d:%02d:%02d' % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+    return '%02d:%02d' % (seconds // 60, seconds % 60)
+
+
+statusHeader = '%5s %-8s %7s %9s %6s %8s %5s %5s %5s  %s' % (
+    'host', 'state', 'pid', 'uptime', 'cpu%', 'rss MB', 'err', 'recon', 'crash',
+    'last log line')
+
+
+def toGbps(val, units):
+    "Convert an iperf rate in units to Gb/s."
+    if units[0] == 'M':
+        val *= 10 ** -3
+    elif units[0] == 'K':
+        val *= 10 ** -6
+    elif units[0] == 'b':
+        val *= 10 ** -9
+    return val
+
+
+def percentile(values, p):
+    "Return the p-th percentile of the sorted list values (nearest rank)."
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(p / 100.0 * len(values)))]
+
+
+class IperfStream(object):
+    """Parse the iperf output of one host as it arrives. Only complete
+       lines are parsed, so a rate split across chunks is not lost.
+       The rates of the streams of one interval are held until the
+       interval is complete: a [SUM] line, a line of another interval
+       or expire() ends it. A [SUM] line replaces the stream rates."""
+
+    # [  3]  0.0- 1.0 sec   112 MBytes   940 Mbits/sec
+    report = re.compile(r'\[\s*(\w+)\]\s+(\d+\.?\d*)\s*-\s*(\d+\.?\d*)\s+sec'
+                        r'.*?(\d+\.?\d*) ([KMG]?bits)/sec')
+
+    def __init__(self, history=3600):
+        self.partial = ''
+        self.series = deque(maxlen=history)
+        self.interval = None
+        self.rates = {}
+        self.since = None
+        self.step = None
+        self.total = None
+
+    def feed(self, text, now=None):
+        "Parse text; return the (start, end, Gb/s) intervals it completed."
+        if now is None:
+            now = time.time()
+        lines = (self.partial + text).split('\n')
+        # Avoid holding on to output that never ends a line
+        self.partial = lines.pop()[-256:]
+        done = []
+        for line in lines:
+            m = 'bits/sec' in line and self.report.search(line)
+            if not m:
+                continue
+            stream = m.group(1)
+            interval = float(m.group(2)), float(m.group(3))
+            if interval != self.interval:
+                self.complete(done)
+                self.interval, self.since = interval, now
+            self.rates[stream] = toGbps(float(m.group(4)), m.group(5))
+            if stream == 'SUM':
+                self.complete(done)
+        return done
+
+    def expire(self, now, age=0.5):
+        "Complete an interval that got no more lines for age seconds."
+        done = []
+        if self.interval is not None and now - self.since >= age:
+            self.complete(done)
+        return done
+
+    def complete(self, done):
+        "Close the pending interval, adding it to done unless it is a summary."
+        if self.interval is None:
+            return
+        begin, end = self.interval
+        rates, self.rates, self.interval = self.rates, {}, None
+        rate = rates.get('SUM', sum(rates.values()))
+        if self.step is None or end - begin < self.step:
+            self.step = end - begin
+        if begin == 0 and end - begin > self.step:
+            # The summary of a run with interval reports
+            self.total = rate
+            return
+        self.series.append((begin, end, rate))
+        done.append((begin, end, rate))
+
+
+class IperfAggregator(object):
+    """Per-host iperf rates combined into one bar per wall-clock
+       interval. A host that reported several iperf intervals in one
+       wall-clock interval counts once, with its mean rate."""
+
+    def __init__(self):
+        self.hosts = {}
+        self.current = {}
+
+    def feed(self, host, text, now=None):
+        "Take output of host."
+        stream = self.hosts.get(host)
+        if stream is None:
+            stream = self.hosts[host] = IperfStream()
+        self.add(host, stream.feed(text, now))
+
+    def add(self, host, intervals):
+        for _begin, _end, rate in intervals:
+            self.current.setdefault(host, []).append(rate)
+
+    def flush(self, now=None):
+        """Return Object(time, hosts, sum, min, max, p50, p95) over the
+           hosts that reported since the last flush, or None."""
+        if now is None:
+            now = time.time()
+        for host, stream in self.hosts.items():
+            self.add(host, stream.expire(now))
+        if not self.current:
+            return None
+        current, self.current = self.current, {}
+        rates = sorted(sum(r) / len(r) for r in current.values())
+        return Object(time=now, hosts=len(rates), sum=sum(rates),
+                      min=rates[0], max=rates[-1],
+                      p50=percentile(rates, 50), p95=percentile(rates, 95))
+
+    def series(self, host):
+        "Return the (start, end, Gb/s) intervals host reported."
+        stream = self.hosts.get(host)
+        return list(stream.series) if stream else []
+
+
+def formatBar(bar):
+    "Return a one line description of an aggregate bar."
+    return ('%.3f Gb/s from %d hosts, min %.3f p50 %.3f p95 %.3f max %.3f' %
+            (bar.sum, bar.hosts, bar.min, bar.p50, bar.p95, bar.max))
+
+
+def overlayAddress(i):
+    "Return the overlay address of host i."
+    base = [int(part) for part in overlay_base.split('.')]
+    n = (base[0] << 24 | base[1] << 16 | base[2] << 8 | base[3]) + i
+    return '%d.%d.%d.%d' % (n >> 24 & 0xff, n >> 16 & 0xff, n >> 8 & 0xff, n & 0xff)
+
+
+class MeshProbe(object):
+    """Measure how the overlay converges. Every launched host pings the
+       overlay addresses of the launched hosts it has not reached yet,
+       from popen(i, args) processes run at most concurrency at a time.
+       The first time each pair is reachable is kept. A host joined when
+       it reached every host there was, and the mesh is full when every
+       pair was reachable. A step runs from the first launch added after
+       a full mesh to the next full mesh; hosts seeded as already running
+       take part in the mesh but do not start a step. Without fping, at
+       most pingParallel pings of a host run at once."""
+
+    pingParallel = 32
+
+    def __init__(self, popen, concurrency=probe_concurrency,
+                 interval=probe_interval_ms / 1000.0, fping=None):
+        self.popen = popen
+        self.concurrency = concurrency
+        self.interval = interval
+        if fping is None:
+            fping = bool(quietRun('which fping').strip())
+        self.fping = fping
+        self.hosts = {}
+        self.first = {}
+        self.unreached = {}
+        self.joined = {}
+        self.running = {}
+        self.lastProbe = {}
+        self.seeded = set()
+        self.stepStart = None
+        self.steps = []
+
+    def add(self, i, launched, seed=False):
+        """Probe host i, whose daemon was launched at time launched.
+           A seed host was running before the probe started."""
+        if i not in self.hosts:
+            self.unreached[i] = set(self.hosts)
+            for j in self.hosts:
+                self.unreached[j].add(i)
+        self.hosts[i] = launched
+        if seed:
+            self.seeded.add(i)
+        elif self.stepStart is None or launched < self.stepStart:
+            self.stepStart = launched
+
+    def remove(self, indices):
+        "Stop probing hosts indices."
+        removed = set(indices)
+        for i in indices:
+            self.hosts.pop(i, None)
+            self.unreached.pop(i, None)
+            self.joined.pop(i, None)
+            self.seeded.discard(i)
+            ping = self.running.pop(i, None)
+            if ping is not None:
+                self.kill(ping)
+        for targets in self.unreached.values():
+            targets -= removed
+        self.first = dict((pair, t) for pair, t in self.first.items()
+                          if pair[0] in self.hosts and pair[1] in self.hosts)
+
+    def missing(self, i):
+        "Return the hosts that host i did not reach yet."
+        return sorted(self.unreached[i])
+
+    def command(self, targets):
+        addresses = [overlayAddress(j) for j in targets]
+        if self.fping:
+            return ['fping', '-a', '-r', '0', '-t', '500'] + addresses
+        return ['sh', '-c', 'printf "%%s\\n" %s | xargs -n 1 -P %d sh -c '
+                '\'ping -c1 -W1 $0 >/dev/null 2>&1 && echo $0\'' %
+                (' '.join(addresses), self.pingParallel)]
+
+    def poll(self, now=None):
+        "Collect finished pings and start new ones; return whether any run."
+        if now is None:
+            now = time.time()
+        addresses = None
+        for i, ping in list(self.running.items()):
+            done = ping.proc.poll() is not None
+            data = self.read(ping)
+            if done:
+                data = ping.partial + data
+                del self.running[i]
+                ping.proc.stdout.close()
+            else:
+                data, _, ping.partial = (ping.partial + data).rpartition('\n')
+            if not data:
+                continue
+            if addresses is None:
+                addresses = dict((overlayAddress(j), j) for j in self.hosts)
+            for line in data.split():
+                j = addresses.get(line.strip())
+                if j in self.unreached[i]:
+                    self.unreached[i].discard(j)
+                    self.first[(i, j)] = now
+        for i in self.hosts:
+            if i not in self.joined and not self.unreached[i]:
+                self.joined[i] = now
+        if self.stepStart is not None and self.coverage() == 1.0:
+            self.closeStep(now)
+        for i in sorted(self.hosts, key=lambda i: self.lastProbe.get(i, 0)):
+            if len(self.running) >= self.concurrency:
+                break
+            if not self.unreached[i] or i in self.running:
+                continue
+            if now - self.lastProbe.get(i, 0) < self.interval:
+                continue
+            self.lastProbe[i] = now
+            proc = self.popen(i, self.command(self.missing(i)))
+            flags = fcntl.fcntl(proc.stdout, fcntl.F_GETFL)
+            fcntl.fcntl(proc.stdout, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+            self.running[i] = Object(proc=proc, partial='')
+        return bool(self.running)
+
+    def read(self, ping):
+        "Return the output of ping that is ready, without blocking."
+        chunks = []
+        while True:
+            try:
+                data = os.read(ping.proc.stdout.fileno(), 65536)
+            except OSError:
+                break
+            if not data:
+                break
+            chunks.append(data)
+        return ''.join(chunks)
+
+    def kill(self, ping):
+        "Kill ping if it still runs and close its output."
+        if ping.proc.poll() is None:
+            ping.proc.kill()
+        ping.proc.wait()
+        ping.proc.stdout.close()
+
+    def coverage(self):
+        "Return the share of the host pairs that were reachable."
+        n = len(self.hosts)
+        if n < 2:
+            return 1.0
+        return float(len(self.first)) / (n * (n - 1))
+
+    def closeStep(self, now):
+        "Record the step that just reached a full mesh."
+        joins = sorted(self.joined[i] - self.hosts[i] for i in self.hosts
+                       if i not in self.seeded and self.hosts[i] >= self.stepStart)
+        step = {'time': round(now, 3), 'hosts': len(self.hosts),
+                'full_mesh': round(now - self.stepStart, 3),
+                'join_p50': round(percentile(joins, 50), 3) if joins else None,
+                'join_p99': round(percentile(joins, 99), 3) if joins else None}
+        self.steps.append(step)
+        self.stepStart = None
+        print('full mesh of %(hosts)d hosts after %(full_mesh).2fs' % step +
+              (', join p50 %(join_p50).2fs p99 %(join_p99).2fs' % step
+               if joins else ''))
+
+    def save(self, path):
+        """Write the steps, the join time of every host and the time each
+           pair was first reachable to path as JSON."""
+        f = open(path, 'w')
+        json.dump({'steps': self.steps, 'hosts': dict(
+            (str(i), {'launched': round(self.hosts[i], 3),
+                      'seeded': i in self.seeded,
+                      'joined': round(self.joined[i], 3) if i in self.joined else None})
+            for i in self.hosts),
+            'pairs': [{'from': i, 'to': j, 'first': round(self.first[(i, j)], 3)}
+                      for i, j in sorted(self.first)]},
+            f, indent=2, sort_keys=True)
+        f.close()
+
+    def stop(self):
+        "Kill the pings still running."
+        for ping in self.running.values():
+            self.kill(ping)
+        self.running = {}
+
+
+def allToOne(hosts, rand, count=None):
+    "Every host sends to the first one."
+    return [(i, hosts[0]) for i in hosts[1:]]
+
+
+def ring(hosts, rand, count=None):
+    "Every host sends to the next one."
+    return [(hosts[k], hosts[(k + 1) % len(hosts)]) for k in range(len(hosts))]
+
+
+def permutation(hosts, rand, count=None):
+    "Every host sends to another one and receives from another one."
+    order = list(hosts)
+    rand.shuffle(order)
+    return ring(order, rand)
+
+
+def randomPairs(hosts, rand, count=None):
+    """count distinct random pairs of hosts, drawn one by one so that
+       the n * (n - 1) pairs are only listed when most of them are asked for."""
+    count = count or traffic_pairs
+    n = len(hosts)
+    if 2 * count >= n * (n - 1):
+        pairs = [(i, j) for i in hosts for j in hosts if i != j]
+        return rand.sample(pairs, min(count, len(pairs)))
+    pairs, seen = [], set()
+    while len(pairs) < count:
+        pair = tuple(rand.sample(hosts, 2))
+        if pair not in seen:
+            seen.add(pair)
+            pairs.append(pair)
+    return pairs
+
+
+trafficPatterns = {
+    'all-to-one': allToOne,
+    'ring': ring,
+    'permutation': permutation,
+    'pairs': randomPairs
+}
+
+
+class TrafficScheduler(object):
+    """Run iperf between pairs of hosts over the overlay. Servers start
+       on every receiving host, then clients start stagger seconds apart
+       from popen(i, args, quiet) processes; the output of quiet ones,
+       the servers, is dropped. Client output is handed to
+       feed(pair, text) as it arrives, and each client's result is kept
+       once it exits."""
+
+    serverDelay = 0.5
+
+    def __init__(self, popen, pairs, feed, duration=traffic_duration,
+                 streams=traffic_streams, stagger=traffic_stagger):
+        self.popen = popen
+        self.pairs = pairs
+        self.feed = feed
+        self.duration = duration
+        self.streams = streams
+        self.stagger = stagger
+        self.servers = {}
+        self.clients = {}
+        self.results = {}
+        self.began = None
+
+    def poll(self, now=None):
+        "Start, read and reap the iperf processes; return whether any run."
+        if now is None:
+            now = time.time()
+        if self.began is None:
+            self.began = now
+            for j in sorted(set(j for _i, j in self.pairs)):
+                self.servers[j] = self.popen(j, ['iperf', '-s'], quiet=True)
+        for k, pair in enumerate(self.pairs):
+            if pair in self.clients or pair in self.results:
+                continue
+            if now < self.began + self.serverDelay + k * self.stagger:
+                break
+            proc = self.popen(pair[0], [
+                'iperf', '-c', overlayAddress(pair[1]), '-t', str(self.duration),
+                '-P', str(self.streams), '-i', '1'])
+            flags = fcntl.fcntl(proc.stdout, fcntl.F_GETFL)
+            fcntl.fcntl(proc.stdout, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+            self.clients[pair] = Object(proc=proc, started=now)
+        for pair, client in list(self.clients.items()):
+            self.read(pair, client)
+            if client.proc.poll() is None:
+                continue
+            self.read(pair, client)
+            client.proc.stdout.close()
+            del self.clients[pair]
+            self.results[pair] = {'client': pair[0], 'server': pair[1],
+                                  'started': round(client.started, 3),
+                                  'ended': round(now, 3),
+                                  'returncode': client.proc.returncode}
+        if len(self.results) == len(self.pairs):
+            self.stop()
+            return False
+        return True
+
+    def read(self, pair, client):
+        try:
+            data = os.read(client.proc.stdout.fileno(), 65536)
+        except OSError:
+            return
+        while data:
+            self.feed(pair, data)
+            try:
+                data = os.read(client.proc.stdout.fileno(), 65536)
+            except OSError:
+                return
+
+    def stop(self):
+        "Kill the clients still running and the servers."
+        for client in self.clients.values():
+            if client.proc.poll() is None:
+                client.proc.kill()
+            client.proc.wait()
+            client.proc.stdout.close()
+        self.clients = {}
+        for proc in self.servers.values():
+            if proc.poll() is None:
+                proc.kill()
+            proc.wait()
+        self.servers = {}
+
+
+class PidRegistry(object):
+    """Daemon pids by host, taken from the pidfile each daemon writes,
+       so that stopping or querying a host never scans the process table."""
+
+    def __init__(self):
+        self.pids = {}
+        self.watching = {}
+
+    def add(self, i, pid, watching=False):
+        "Register pid as the daemon of host i."
+        self.pids[i] = pid
+        self.watching[i] = watching
+
+    def load(self, indices):
+        "Register the live daemons already running on hosts indices."
+        for i in indices:
+            pid = readPid(i)
+            if pid is not None and pidAlive(pid):
+                kind = daemonKind(pid, i)
+                if kind is not None:
+                    self.add(i, pid, kind == 'watch')
+
+    def status(self, i):
+        "Return 'running', 'dead' or 'unknown' for host i."
+        if i not in self.pids:
+            return 'unknown'
+        if pidAlive(self.pids[i]):
+            return 'running'
+        return 'dead'
+
+    def stop(self, indices):
+        """Ask the daemons of hosts indices to stop without waiting for
+           them: 'vlan stop' for vland daemons, SIGTERM for watchers.
+           Hosts that are not registered, because their daemon is still
+           starting or wrote its pidfile after the launch timed out, are
+           looked up in their pidfile. Returns the stop to pass to reap()
+           until it is done."""
+        pids = {}
+        watching = {}
+        for i in indices:
+            if i in self.pids:
+                pid = self.pids.pop(i)
+                watching[i] = self.watching.pop(i, False)
+            else:
+                pid = readPid(i)
+            if pid is None or not pidAlive(pid):
+                continue
+            kind = daemonKind(pid, i)
+            if kind is None:
+                continue
+            pids[i] = pid
+            watching[i] = watching.get(i) or kind == 'watch'
+        stoppers = []
+        devnull = open(os.devnull, 'w')
+        for i in pids:
+            if watching[i]:
+                self.signal(pids[i], signal.SIGTERM)
+                continue
+            try:
+                stoppers.append(Popen(stopCommand(i), stdout=devnull,
+                                      stderr=devnull, close_fds=True))
+            except OSError:
+                self.signal(pids[i], signal.SIGTERM)
+        devnull.close()
+        return Object(pids=pids, stoppers=stoppers, began=time.time(),
+                      termed=False, killed=0)
+
+    def reap(self, stopping, now=None, grace=stop_grace, timeout=stop_timeout):
+        """Send SIGTERM to the daemons of stopping still alive after grace
+           seconds, and SIGKILL after timeout seconds. Returns the number
+           of daemons stopped and killed once all are gone, else None."""
+        if now is None:
+            now = time.time()
+        alive = [pid for i, pid in stopping.pids.items()
+                 if pidAlive(pid) and daemonKind(pid, i) is not None]
+        if alive and not stopping.termed and now - stopping.began >= grace:
+            stopping.termed = True
+            for pid in alive:
+                self.signal(pid, signal.SIGTERM)
+        if alive and now - stopping.began >= timeout:
+            for pid in alive:
+                self.signal(pid, signal.SIGKILL)
+            stopping.killed = len(alive)
+            alive = []
+        if alive:
+            return None
+        for proc in stopping.stoppers:
+            if proc.poll() is None:
+                proc.kill()
+            proc.wait()
+        return len(stopping.pids), stopping.killed
+
+    def signal(self, pid, sig):
+        try:
+            os.kill(pid, sig)
+        except OSError:
+            pass
+
+    def summary(self):
+        "Return a one line summary of the registered daemons."
+        running = [i for i in self.pids if pidAlive(self.pids[i])]
+        return ('registered: %d, running: %d, dead: %d' %
+                (len(self.pids), len(running), len(self.pids) - len(running)))
+
+
+class Launcher(object):
+    """Start daemons on hosts at a bounded rate and track their state.
+       Each host goes pending -> started -> running, or failed when no
+       pidfile shows up within the timeout. send(i, cmd) returns False
+       when host i cannot take a command yet; the launch is retried
+       until the host has been busy for the timeout, then it failed."""
+
+    def __init__(self, send, registry=None, concurrency=launch_concurrency,
+                 rate=launch_rate, timeout=launch_timeout):
+        self.send = send
+        self.registry = registry
+        self.concurrency = concurrency
+        self.rate = float(rate)
+        self.timeout = timeout
+        self.hosts = {}
+        self.queue = []
+        self.nextLaunch = 0
+
+    def submit(self, indices, watching=False):
+        "Queue the daemons of hosts indices for launch."
+        for i in indices:
+            self.hosts[i] = Object(state='pending', watching=watching,
+                                   launched=None, running=None, delay=None,
+                                   busySince=None)
+            self.queue.append(i)
+
+    def inState(self, state):
+        "Return the hosts in state."
+        return [i for i in self.hosts if self.hosts[i].state == state]
+
+    def poll(self, now=None):
+        "Advance every launch; return whether any is still in progress."
+        if now is None:
+            now = time.time()
+        started = self.inState('started')
+        for i in started:
+            host = self.hosts[i]
+            pid = readPid(i)
+            if pid is not None:
+                host.state, host.running = 'running', now
+                host.delay = now - host.launched
+                if self.registry is not None:
+                    self.registry.add(i, pid, host.watching)
+                print('i: %d running after %.2fs' % (i, host.delay))
+            elif now - host.launched > self.timeout:
+                host.state = 'failed'
+                print('i: %d failed, no pidfile after %ds' % (i, self.timeout))
+        busy = len(self.inState('started'))
+        if self.nextLaunch < now - 1:
+            self.nextLaunch = now
+        deferred = []
+        while self.queue and busy < self.concurrency and now >= self.nextLaunch:
+            i = self.queue.pop(0)
+            host = self.hosts[i]
+            try:
+                os.remove(pidfile(i))
+            except OSError:
+                pass
+            if not self.send(i, daemonCommand(i, host.watching)):
+                if host.busySince is None:
+                    host.busySince = now
+                if now - host.busySince > self.timeout:
+                    host.state = 'failed'
+                    print('i: %d failed, shell busy for %ds' % (i, self.timeout))
+                else:
+                    deferred.append(i)
+                continue
+            host.state, host.launched = 'started', now
+            print('i: ' + str(i) + ' ............')
+            busy += 1
+            self.nextLaunch += 1 / self.rate
+        self.queue.extend(deferred)
+        return bool(self.queue) or busy > 0
+
+    def cancel(self, indices):
+        "Forget the hosts indices, launched or not."
+        for i in indices:
+            self.hosts.pop(i, None)
+        self.queue = [i for i in self.queue if i in self.hosts]
+
+    def summary(self):
+        "Return a one line summary of the launches."
+        delays = sorted(self.hosts[i].delay for i in self.inState('running'))
+        s = ('running: %d, failed: %d, pending: %d, started: %d' %
+             (len(delays), len(self.inState('failed')),
+              len(self.inState('pending')), len(self.inState('started'))))
+        if delays:
+            s += (', pidfile after p50 %.2fs max %.2fs' %
+                  (delays[len(delays) // 2], delays[-1]))
+        return s
+
+
+class OutputMux(object):
+    """Read the output of many nodes from a single epoll loop on a
+       background thread. Output is queued per node and picked up by
+       the GUI in batches with drain()."""
+
+    def __init__(self):
+        self.poller = select.epoll()
+        self.nodes = {}
+        self.queues = {}
+        self.nodeLocks = {}
+        self.ready = set()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.running = False
+
+    def register(self, node):
+        "Start reading the output of node."
+        fd = node.stdout.fileno()
+        self.nodes[fd] = node
+        self.queues[node] = deque()
+        self.nodeLocks[node] = threading.Lock()
+        self.poller.register(fd, select.EPOLLIN)
+
+    def send(self, node, cmd):
+        """Send cmd to node unless it is busy; return whether it was sent.
+           Mininet's sendCmd() writes the command before it sets waiting,
+           so the node's lock keeps monitor() from reading the prompt in
+           between and leaving the node waiting for good."""
+        with self.nodeLocks[node]:
+            if node.waiting:
+                return False
+            node.sendCmd(cmd)
+            return True
+
+    def unregister(self, fd):
+        self.nodes.pop(fd, None)
+        try:
+            self.poller.unregister(fd)
+        except (IOError, ValueError):
+            pass
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='OutputMux')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+        self.poller.close()
+
+    def run(self):
+        "Move node output into the queues until stopped."
+        while self.running:
+            try:
+                events = self.poller.poll(0.1)
+            except IOError:
+                continue
+            for fd, event in events:
+                node = self.nodes.get(fd)
+                if node is None:
+                    continue
+                if not event & select.EPOLLIN:
+                    self.unregister(fd)
+                    continue
+                try:
+                    with self.nodeLocks[node]:
+                        data = node.monitor(0)
+                        idle = not node.waiting
+                except (OSError, IOError):
+                    self.unregister(fd)
+                    continue
+                if not data and event & (select.EPOLLHUP | select.EPOLLERR):
+                    self.unregister(fd)
+                    continue
+                self.queues[node].append((data, idle))
+                with self.lock:
+                    self.ready.add(node)
+
+    def drain(self):
+        "Return the chunks of (data, idle) queued per node since the last drain."
+        with self.lock:
+            ready, self.ready = self.ready, set()
+        batches = {}
+        for node in ready:
+            queue = self.queues[node]
+            chunks = []
+            while queue:
+                chunks.append(queue.popleft())
+            batches[node] = chunks
+        return batches
+
+
+class DaemonControl(object):
+    """Launch, stop and query host daemons. Mixed into the Tk and the
+       headless applications, which provide sendToHost() and after()."""
+
+    def initDaemons(self):
+        self.registry = PidRegistry()
+        self.registry.load(range(1, servers + clients + 1))
+        self.launcher = Launcher(self.sendToHost, self.registry)
+        self.launching = False
+        self.stopping = []
+        self.sampler = ProcSampler()
+        self.resourceSampler = ProcSampler()
+        self.resourceLog = None
+        if resource_log is not None:
+            self.resourceLog = ResourceLog(resource_log)
+        self.resources = None
+        self.after(sample_interval_ms, self.monitorResources)
+        self.tailer = LogTailer()
+        self.eventLog = None
+        if event_log is not None:
+            self.eventLog = open(event_log, 'a')
+        self.after(log_interval_ms, self.monitorLogs)
+        self.probe = None
+        self.traffic = None
+
+    def stopHosts(self, indices):
+        "Stop the daemons of hosts indices."
+        self.launcher.cancel(indices)
+        if self.probe is not None:
+            self.probe.remove(indices)
+        stopping = self.registry.stop(indices)
+        if not stopping.pids:
+            return
+        self.stopping.append(stopping)
+        if len(self.stopping) == 1:
+            self.after(50, self.reapStopped)
+
+    def reapStopped(self):
+        "Escalate the pending stops until their daemons are gone."
+        for stopping in list(self.stopping):
+            result = self.registry.reap(stopping)
+            if result is not None:
+                self.stopping.remove(stopping)
+                print('stopped: %d, killed: %d' % result)
+        if self.stopping:
+            self.after(50, self.reapStopped)
+
+    def stop_vland(self):
+        global number
+        self.stopHosts(range(1, servers + clients + 1))
+        number = 0
+        print('total: ' + str(number))
+
+    def stop_watch(self):
+        watching = self.registry.watching
+        hosts = self.launcher.hosts
+        self.stopHosts([i for i in watching if watching[i]] +
+                       [i for i in hosts if hosts[i].watching and i not in watching])
+
+    def status(self):
+        "Print the state of the launched daemons."
+        print(self.launcher.summary())
+        print(self.registry.summary())
+
+    def hostState(self, i, samples):
+        "Return the state of the daemon of host i given samples of the pids."
+        if i in self.registry.pids:
+            sample = samples.get(self.registry.pids[i])
+            if sample is None or sample.state == 'Z':
+                return 'dead'
+            return 'running'
+        host = self.launcher.hosts.get(i)
+        if host is not None:
+            return host.state
+        return 'idle'
+
+    def statusTable(self):
+        "Return one status line per host, sampling every daemon once."
+        samples = self.sampler.sample(self.registry.pids.values())
+        lines = []
+        for i in range(1, servers + clients + 1):
+            state = self.hostState(i, samples)
+            pid = self.registry.pids.get(i)
+            sample = samples.get(pid)
+            if state != 'running':
+                sample = None
+            counts = self.tailer.counts.get(i, {})
+            lines.append('%5d %-8s %7s %9s %6s %8s %5s %5s %5s  %s' % (
+                i, state, pid or '-',
+                formatUptime(sample.uptime) if sample else '-',
+                '%.1f' % sample.cpu if sample and sample.cpu is not None else '-',
+                '%.1f' % (sample.rss / 1048576.0) if sample else '-',
+                counts.get('error', ''), counts.get('reconnect', ''),
+                counts.get('crash', ''), self.tailer.last(i)[:80]))
+        return lines
+
+    def sampleResources(self):
+        "Sample every registered daemon in one pass, log and summarize it."
+        samples = self.resourceSampler.sample(self.registry.pids.values(),
+                                              detail=True)
+        now = round(time.time(), 3)
+        records = []
+        for i, pid in sorted(self.registry.pids.items()):
+            sample = samples.get(pid)
+            if sample is None or sample.state == 'Z':
+                continue
+            record = {'time': now, 'launched': number, 'host': i,
+                      'pid': pid, 'rss': sample.rss}
+            for key in ('cpu', 'vctxt', 'nvctxt', 'read', 'write'):
+                value = getattr(sample, key)
+                record[key] = None if value is None else round(value, 2)
+            records.append(record)
+        if self.resourceLog is not None:
+            self.resourceLog.write(records)
+        return summarizeResources(records)
+
+    def monitorResources(self):
+        "Sample the daemons and show the summary, on a timer."
+        self.resources = self.sampleResources()
+        self.showResources(self.resources)
+        self.after(sample_interval_ms, self.monitorResources)
+
+    def showResources(self, summary):
+        pass
+
+    def monitorLogs(self):
+        "Read what the daemons logged, report crashes and count lines."
+        crashes = self.tailer.poll(range(1, servers + clients + 1))
+        for i, path in crashes:
+            print('i: %d crashed, %s' % (i, path))
+        counts = self.tailer.flush()
+        if self.eventLog is not None and (crashes or any(counts.values())):
+            self.eventLog.write(json.dumps({
+                'time': round(time.time(), 3), 'launched': number,
+                'interval': counts, 'totals': self.tailer.totals(),
+                'crashes': [{'host': i, 'file': path} for i, path in crashes]
+            }, sort_keys=True) + '\n')
+            self.eventLog.flush()
+        self.showLogs(counts)
+        self.after(log_interval_ms, self.monitorLogs)
+
+    def showLogs(self, counts):
+        pass
+
+    def popenHost(self, i, args, stderr=None, quiet=False):
+        """Run args on host i, apart from its shell; return the process.
+           Its error output is dropped unless stderr says otherwise, and
+           a quiet process has all of its output dropped."""
+        devnull = open(os.devnull, 'w')
+        opts = {'stderr': stderr or devnull}
+        if quiet:
+            opts = {'stdout': devnull, 'stderr': devnull}
+        try:
+            return self.net.hosts[i - start].popen(args, **opts)
+        finally:
+            devnull.close()
+
+    def startTraffic(self, pattern=None, count=None, seed=None):
+        "Run iperf between the hosts with running daemons in pattern."
+        if self.traffic is not None:
+            print('traffic is already running')
+            return
+        pattern = pattern or traffic_pattern
+        hosts = sorted(i for i in self.registry.pids
+                       if pidAlive(self.registry.pids[i]))
+        if len(hosts) < 2:
+            print('traffic needs two hosts with running daemons')
+            return
+        pairs = trafficPatterns[pattern](hosts, random.Random(seed), count)
+        self.trafficPattern = pattern
+        self.traffic = TrafficScheduler(
+            lambda i, args, quiet=False: self.popenHost(i, args, STDOUT, quiet),
+            pairs,
+            lambda pair, text: self.iperf.feed(('traffic',) + pair, text),
+            traffic_duration, traffic_streams, traffic_stagger)
+        print('traffic: %s over %d pairs for %ds' %
+              (pattern, len(pairs), traffic_duration))
+        self.pollTraffic()
+
+    def pollTraffic(self):
+        "Drive the traffic until every client is done, then save the results."
+        traffic = self.traffic
+        if traffic is None:
+            return
+        if traffic.poll():
+            self.after(100, self.pollTraffic)
+            return
+        results = []
+        for pair in traffic.pairs:
+            result = dict(traffic.results[pair])
+            stream = self.iperf.hosts.get(('traffic',) + pair)
+            if stream is not None:
+                # The client exited, so its last lines are complete
+                self.iperf.add(('traffic',) + pair, stream.expire(time.time(), 0))
+            result['gbps'] = stream.total if stream else None
+            if stream and stream.total is None and stream.series:
+                result['gbps'] = stream.series[-1][2]
+            results.append(result)
+        rates = [r['gbps'] for r in results if r['gbps'] is not None]
+        f = open(traffic_results, 'w')
+        json.dump({'pattern': self.trafficPattern, 'duration': traffic_duration,
+                   'streams': traffic_streams, 'stagger': traffic_stagger,
+                   'total_gbps': sum(rates), 'pairs': results},
+                  f, indent=2, sort_keys=True)
+        f.close()
+        print('traffic: %.3f Gb/s over %d of %d pairs, results written to %s' %
+              (sum(rates), len(rates), len(results), traffic_results))
+        self.traffic = None
+
+    def stopTraffic(self):
+        if self.traffic is not None:
+            self.traffic.stop()
+            self.traffic = None
+
+    def startProbe(self):
+        """Probe the mesh of the running daemons and of those launched
+           from now on."""
+        if self.probe is not None:
+            return
+        self.probe = MeshProbe(self.popenHost)
+        for i, pid in self.registry.pids.items():
+            if pidAlive(pid):
+                host = self.launcher.hosts.get(i)
+                self.probe.add(i, host.launched if host else time.time(), seed=True)
+        print('probing the overlay mesh')
+        self.pollProbe()
+
+    def stopProbe(self):
+        "Stop probing and save the results."
+        if self.probe is None:
+            return
+        self.probe.stop()
+        self.probe.save(probe_results)
+        print('mesh probe results written to ' + probe_results)
+        self.probe = None
+
+    def pollProbe(self):
+        probe = self.probe
+        if probe is None:
+            return
+        probe.poll()
+        self.showProbe(probe)
+        self.after(min(100, probe_interval_ms), self.pollProbe)
+
+    def showProbe(self, probe):
+        pass
+
+    def disable_watch(self):
+        global watch
+        watch = 0
+        print('disabled watch')
+
+    def enable_watch(self):
+        global watch
+        watch = 1
+        print('enabled watch')
+
+    def launch(self, upto=None, count=None):
+        """Launch daemons on the hosts after the last launched one,
+           up to host upto or count more hosts, all of them by default."""
+        global number
+        last = servers + clients
+        if upto is not None:
+            last = min(last, upto)
+        if count is not None:
+            last = min(last, number + count)
+        if last > number:
+            self.launcher.submit(range(number + 1, last + 1), watch > 0)
+            number = last
+        print('total: ' + str(number))
+        if not self.launching:
+            self.launching = True
+            self.pollLauncher()
+
+    def pollLauncher(self):
+        "Drive the launcher until every queued daemon runs or failed."
+        busy = self.launcher.poll()
+        if self.probe is not None:
+            for i in self.launcher.inState('running'):
+                if i not in self.probe.hosts:
+                    self.probe.add(i, self.launcher.hosts[i].launched)
+        if busy:
+            self.after(50, self.pollLauncher)
+        else:
+            self.launching = False
+            print(self.launcher.summary())
+
+    def debug_reduce_10(self):
+        global number
+        if number <= 0:
+            print('Already is 0')
+            return
+        end = max(number - 10, 0)
+        self.stopHosts(range(end + 1, number + 1))
+        number = end
+        print('total: ' + str(number))
+
+
+class ConsoleApp(Frame, DaemonControl):
     "Simple Tk consoles for Mininet."
 
     menuStyle = {'font': 'Geneva 7 bold'}
 
-    def __init__(self, net, parent=None, width=4):
+    def __init__(self, net, parent=None, width=4, rows=console_rows):
         Frame.__init__(self, parent)
         self.top = self.winfo_toplevel()
         self.gheight = 800
@@ -340,92 +2108,145 @@ class ConsoleApp(Frame):
         self.menubar = self.createMenuBar()
         self.consoles = {}
 
-        self.sconsoles = {}  # consoles themselves
         titles = {
             'hosts': 'Host',
             'switches': 'Switch',
             'controllers': 'Controller'
         }
-        # (servers + clients) * 20
 
-        canvas = self.canvas = Canvas(self, width=1600, height=800,
-                                      scrollregion=(0, 0, 0, ((servers + nathost + clients + 200) // 4) * 280))
+        # Every node keeps a compact output buffer, and only the
+        # rows of consoles in view have widgets
+        self.buffers = {}
+        for name in titles:
+            for node in getattr(net, name):
+                self.buffers[node] = OutputBuffer()
+                node.sendCmd('export TERM=dumb')
+
+        # Read every node's output off the GUI thread
+        self.mux = OutputMux()
 
-        # cframe = self.cframe = Frame(canvas, width=1600, height=((servers + nathost + clients + 3) // 4) * 264)
-        cframe = self.cframe = Frame(canvas)
+        cframe = self.cframe = Frame(self)
         for name in titles:
-            nodes = getattr(net, name)
-            frame, consoles = self.createConsoles(
-                cframe, nodes, width, titles[name])
-            self.consoles[name] = Object(frame=frame, consoles=consoles)
-        canvas.create_window((800, ((servers + nathost + clients + 100) // 4) * 132), window=cframe)
+            grid = ConsoleGrid(cframe, net, getattr(net, name), self.buffers,
+                               width, rows, titles[name], self.mux.send)
+            self.consoles[name] = Object(frame=grid, consoles=[grid])
         self.selected = None
         self.select('hosts')
-
-        ybar = Scrollbar(self, orient='vertical', command=canvas.yview)
-        canvas.config(yscrollcommand=ybar.set)
-
-        ybar.pack(side='right', fill='y')
-        canvas.pack(expand=True, fill='both')
+        cframe.pack(expand=True, fill='both')
 
         cleanUpScreens()
         # Close window gracefully
         Wm.wm_protocol(self.top, name='WM_DELETE_WINDOW', func=self.quit)
 
-        # Initialize graph
-        graph = Graph(cframe)
-        self.consoles['graph'] = Object(frame=graph, consoles=[graph])
+        # Initialize graphs
+        graphs = Frame(cframe)
+        graph = Graph(graphs, csvPath=graph_csv)
+        cpuGraph = Graph(graphs, ymax=100, title='CPU per daemon (%)')
+        meshGraph = Graph(graphs, ymax=100, title='Mesh pairs reachable (%)')
+        for g in (graph, cpuGraph, meshGraph):
+            g.pack(expand=True, fill='both')
+        self.consoles['graph'] = Object(frame=graphs,
+                                        consoles=[graph, cpuGraph, meshGraph])
         self.graph = graph
+        self.cpuGraph = cpuGraph
+        self.meshGraph = meshGraph
+        self.meshPlotted = 0
         self.graphVisible = False
-        self.updates = 0
-        self.hostCount = len(self.consoles['hosts'].consoles)
-        self.bw = 0
+
+        # Initialize status board
+        board = StatusBoard(cframe, self)
+        self.consoles['status'] = Object(frame=board, consoles=[board])
+        self.iperf = IperfAggregator()
+        self.outputHooks = {}
+        self.setOutputHook(self.updateGraph)
+        self.after(iperf_interval_ms, self.flushBandwidth)
+
+        self.initDaemons()
+
+        for node in self.buffers:
+            self.mux.register(node)
+        self.mux.start()
+        self.drainOutput()
 
         self.pack(expand=True, fill='both')
 
-    def updateGraph(self, _console, output):
-        "Update our graph."
-        m = re.search(r'(\d+.?\d*) ([KMG]?bits)/sec', output)
-        if not m:
+    def drainOutput(self):
+        "Hand the output read since the last call to buffers, consoles and hooks."
+        for node, chunks in self.mux.drain().items():
+            console = self.consoleFor(node)
+            hook = self.outputHooks.get(node)
+            for data, idle in chunks:
+                text = Console.ignoreChars.sub('', data)
+                if idle:
+                    # Print prompt
+                    text += node.name + '# '
+                self.buffers[node].append(text)
+                if console is not None:
+                    console.append(text)
+                if hook is not None:
+                    hook(node, text)
+        self.after(drain_ms, self.drainOutput)
+
+    def consoleFor(self, node):
+        "Return the console showing node, or None."
+        for name in ('hosts', 'switches', 'controllers'):
+            console = self.consoles[name].frame.visible.get(node)
+            if console is not None:
+                return console
+        return None
+
+    def updateGraph(self, node, output):
+        "Hand iperf output of node to the aggregator."
+        self.iperf.feed(node, output)
+
+    def flushBandwidth(self):
+        "Add a bar for the hosts that reported since the last one."
+        bar = self.iperf.flush()
+        if bar is not None:
+            self.graph.addBar(bar.sum, bar.time)
+            self.graph.setTitle('Bandwidth: ' + formatBar(bar))
+        self.after(iperf_interval_ms, self.flushBandwidth)
+
+    def showResources(self, summary):
+        "Plot the CPU use per daemon."
+        if summary.cpu is not None:
+            self.cpuGraph.addBar(summary.cpu)
+            self.cpuGraph.setTitle('CPU: ' + formatResources(summary))
+
+    def showProbe(self, probe):
+        "Plot the reachable pairs about once a probe interval."
+        now = time.time()
+        if now - self.meshPlotted < probe_interval_ms / 1000.0:
             return
-        val, units = float(m.group(1)), m.group(2)
-        # convert to Gbps
-        if units[0] == 'M':
-            val *= 10 ** -3
-        elif units[0] == 'K':
-            val *= 10 ** -6
-        elif units[0] == 'b':
-            val *= 10 ** -9
-        self.updates += 1
-        self.bw += val
-        if self.updates >= self.hostCount:
-            self.graph.addBar(self.bw)
-            self.bw = 0
-            self.updates = 0
-
-    def setOutputHook(self, fn=None, consoles=None):
-        "Register fn as output hook [on specific consoles.]"
-        if consoles is None:
-            consoles = self.consoles['hosts'].consoles
-        for console in consoles:
-            console.outputHook = fn
-
-    def createConsoles(self, parent, nodes, width, title):
-        "Create a grid of consoles in a frame."
-        f = Frame(parent)
-        # Create consoles
-        consoles = []
-        index = 0
+        self.meshPlotted = now
+        self.meshGraph.addBar(100 * probe.coverage())
+        text = 'Mesh: %d hosts, %.1f%% of pairs' % (len(probe.hosts),
+                                                   100 * probe.coverage())
+        if probe.steps:
+            text += ', last full mesh after %.2fs' % probe.steps[-1]['full_mesh']
+        self.meshGraph.setTitle(text)
+
+    def toggleProbe(self):
+        if self.probe is None:
+            self.startProbe()
+        else:
+            self.stopProbe()
+
+    def showLogs(self, counts):
+        "Show the log line counts, in total and in the last interval."
+        self.logLabel.configure(text='logs: %s (last %ds: %s)' % (
+            formatCounts(self.tailer.totals()), log_interval_ms // 1000,
+            formatCounts(counts)))
+
+    def setOutputHook(self, fn=None, nodes=None):
+        "Register fn as output hook [on specific nodes.]"
+        if nodes is None:
+            nodes = self.net.hosts
         for node in nodes:
-            console = Console(f, self.net, node, title=title)
-            consoles.append(console)
-            row = index / width
-            column = index % width
-            console.grid(row=row, column=column, sticky='nsew')
-            index += 1
-            f.rowconfigure(row)
-            f.columnconfigure(column, weight=1)
-        return f, consoles
+            if fn is None:
+                self.outputHooks.pop(node, None)
+            else:
+                self.outputHooks[node] = fn
 
     def select(self, groupName):
         "Select a group of consoles to display."
@@ -440,24 +2261,32 @@ class ConsoleApp(Frame):
         buttons = [
             ('Disable_watch', self.disable_watch),
             ('Enable_watch', self.enable_watch),
-            ('Debug_10', self.debug_10),
-            ('Debug_20', self.debug_20),
-            ('Debug_40', self.debug_40),
-            ('Debug_60', self.debug_60),
-            ('Debug_80', self.debug_80),
-            ('Debug_100', self.debug_100),
-            ('Debug_150', self.debug_150),
-            ('Debug_all', self.debug_all),
-            ('Add_10', self.debug_Add_10),
+            ('Debug_10', lambda: self.launch(upto=10)),
+            ('Debug_20', lambda: self.launch(upto=20)),
+            ('Debug_40', lambda: self.launch(upto=40)),
+            ('Debug_60', lambda: self.launch(upto=60)),
+            ('Debug_80', lambda: self.launch(upto=80)),
+            ('Debug_100', lambda: self.launch(upto=100)),
+            ('Debug_150', lambda: self.launch(upto=150)),
+            ('Debug_all', self.launch),
+            ('Add_10', lambda: self.launch(count=10)),
             ('Reduce_10', self.debug_reduce_10),
             ('Stop_vland', self.stop_vland),
             ('Stop_watch', self.stop_watch),
+            ('Status', self.status),
+            ('Probe', self.toggleProbe),
+            ('Traffic', self.startTraffic),
+            ('Hosts', lambda: self.select('hosts')),
+            ('Board', lambda: self.select('status')),
+            ('Graph', lambda: self.select('graph')),
             ('Clear', self.clear),
             ('Quit', self.quit)
         ]
         for name, cmd in buttons:
             b = Button(f, text=name, command=cmd, **self.menuStyle)
             b.pack(side='left')
+        self.logLabel = Label(f, **self.menuStyle)
+        self.logLabel.pack(side='right')
         f.pack(padx=4, pady=4, fill='x')
         return f
 
@@ -466,291 +2295,409 @@ class ConsoleApp(Frame):
         for console in self.selected.consoles:
             console.clear()
         os.system('rm /etc/vlan_test/*/vlan.log /etc/vlan_test/*/crash.*')
+        self.tailer.reset()
 
-
-    def waiting(self, consoles=None):
+    def waiting(self, nodes=None):
         "Are any of our hosts waiting for output?"
-        if consoles is None:
-            consoles = self.consoles['hosts'].consoles
-        for console in consoles:
-            if console.waiting():
+        if nodes is None:
+            nodes = self.net.hosts
+        for node in nodes:
+            if node.waiting:
                 return True
         return False
 
-    def stop_vland(self):
-        os.system('killall vlan vland; killall -9 vlan vland')
-	global number
-	number = 0
-	s = 'total: ' + str(number)
-	print(s)
-
-    def stop_watch(self):
-        os.system('killall vlan; killall -9 vlan')
+    def sendToHost(self, i, cmd):
+        "Send cmd to host i unless it is busy."
+        return self.mux.send(self.net.hosts[i - start], cmd)
 
-    def disable_watch(self):
-	global watch
-	watch = 0
-	print('disabled watch')
 
-    def enable_watch(self):
-	global watch
-	watch = 1
-	print('enabled watch')
+class HeadlessApp(DaemonControl):
+    """Launch, stop and watch host daemons without any widgets.
+       Timers stand in for Tk's after() and run from tick()."""
 
-    def debug_10(self):
-        consoles = self.consoles['hosts'].consoles
-        if self.waiting(consoles):
-            return
-	global number
-        i = start - 1
-        for console in consoles:
-            i += 1
-	    if i > number and i <= 10 :
-		number = i
-		s = 'i: ' + str(i) + ' ............'
-		print(s)
-
-		str_i='/etc/vlan_test/' + str(i)
-		global watch
-		if watch > 0 :
-	                console.sendCmd('nohup ' + local_program_path + '/vlan -c ' + str_i + ' --pidfile=' + str_i + '/vlan.pid watch --logfile=' + str_i + '/vlan.log -d 1 > /dev/null  2>&1 &')
-		else : 
-	                console.sendCmd('nohup ' + local_program_path + '/vland -c ' + str_i + ' --pidfile=' + str_i + '/vlan.pid --logfile=' + str_i + '/vlan.log -d 1 > /dev/null  2>&1 &')
-	s = 'total: ' + str(number)
-	print(s)
-
-
-
-    def debug_20(self):
-        consoles = self.consoles['hosts'].consoles
-        if self.waiting(consoles):
-            return
-	global number
-        i = start - 1
-        for console in consoles:
-            i += 1
-	    if i > number and i <= 20:
-		number = i
-		s = 'i: ' + str(i) + ' ............'
-		print(s)
-
-		str_i='/etc/vlan_test/' + str(i)
-		global watch
-		if watch > 0 :
-	                console.sendCmd('nohup ' + local_program_path + '/vlan -c ' + str_i + ' --pidfile=' + str_i + '/vlan.pid watch --logfile=' + str_i + '/vlan.log -d 1 > /dev/null  2>&1 &')
-		else :
-	                console.sendCmd('nohup ' + local_program_path + '/vland -c ' + str_i + ' --pidfile=' + str_i + '/vlan.pid --logfile=' + str_i + '/vlan.log -d 1 > /dev/null  2>&1 &')
-
-	s = 'total: ' + str(number)
-	print(s)
-
-
-
-    def debug_40(self):
-        consoles = self.consoles['hosts'].consoles
-        if self.waiting(consoles):
-            return
-	global number
-        i = start - 1
-        for console in consoles:
-            i += 1
-	    if i > number and i <= 40:
-		number = i
-		s = 'i: ' + str(i) + ' ............'
-		print(s)
-
-		str_i='/etc/vlan_test/' + str(i)
-		global watch
-		if watch > 0 :
-	                console.sendCmd('nohup ' + local_program_path + '/vlan -c ' + str_i + ' --pidfile=' + str_i + '/vlan.pid watch --logfile=' + str_i + '/vlan.log -d 1 > /dev/null  2>&1 &')
-		else :
-	                console.sendCmd('nohup ' + local_program_path + '/vland -c ' + str_i + ' --pidfile=' + str_i + '/vlan.pid --logfile=' + str_i + '/vlan.log -d 1 > /dev/null  2>&1 &')
-
-	s = 'total: ' + str(number)
-	print(s)
-
-
-
-    def debug_60(self):
-        consoles = self.consoles['hosts'].consoles
-        if self.waiting(consoles):
-            return
-	global number
-        i = start - 1
-        for console in consoles:
-            i += 1
-	    if i > number and i <= 60:
-		number = i
-		s = 'i: ' + str(i) + ' ............'
-		print(s)
-
-		str_i='/etc/vlan_test/' + str(i)
-		global watch
-		if watch > 0 :
-	                console.sendCmd('nohup ' + local_program_path + '/vlan -c ' + str_i + ' --pidfile=' + str_i + '/vlan.pid watch --logfile=' + str_i + '/vlan.log -d 1 > /dev/null  2>&1 &')
-		else :
-	                console.sendCmd('nohup ' + local_program_path + '/vland -c ' + str_i + ' --pidfile=' + str_i + '/vlan.pid --logfile=' + str_i + '/vlan.log -d 1 > /dev/null  2>&1 &')
-
-	s = 'total: ' + str(number)
-	print(s)
-
-
-
-    def debug_80(self):
-        consoles = self.consoles['hosts'].consoles
-        if self.waiting(consoles):
-            return
-	global number
-        i = start - 1
-        for console in consoles:
-            i += 1
-	    if i > number and i <= 80:
-		number = i
-		s = 'i: ' + str(i) + ' ............'
-		print(s)
-
-		str_i='/etc/vlan_test/' + str(i)
-		global watch
-		if watch > 0 :
-	                console.sendCmd('nohup ' + local_program_path + '/vlan -c ' + str_i + ' --pidfile=' + str_i + '/vlan.pid watch --logfile=' + str_i + '/vlan.log -d 1 > /dev/null  2>&1 &')
-		else :
-	                console.sendCmd('nohup ' + local_program_path + '/vland -c ' + str_i + ' --pidfile=' + str_i + '/vlan.pid --logfile=' + str_i + '/vlan.log -d 1 > /dev/null  2>&1 &')
-
-	s = 'total: ' + str(number)
-	print(s)
-
-
-
-    def debug_100(self):
-        consoles = self.consoles['hosts'].consoles
-        if self.waiting(consoles):
-            return
-	global number
-        i = start - 1
-        for console in consoles:
-            i += 1
-	    if i > number and i <= 100:
-		number = i
-		s = 'i: ' + str(i) + ' ............'
-		print(s)
-
-		str_i='/etc/vlan_test/' + str(i)
-		global watch
-		if watch > 0 :
-	                console.sendCmd('nohup ' + local_program_path + '/vlan -c ' + str_i + ' --pidfile=' + str_i + '/vlan.pid watch --logfile=' + str_i + '/vlan.log -d 1 > /dev/null  2>&1 &')
-		else :
-	                console.sendCmd('nohup ' + local_program_path + '/vland -c ' + str_i + ' --pidfile=' + str_i + '/vlan.pid --logfile=' + str_i + '/vlan.log -d 1 > /dev/null  2>&1 &')
-
-	s = 'total: ' + str(number)
-	print(s)
-
-
-
-    def debug_150(self):
-        consoles = self.consoles['hosts'].consoles
-        if self.waiting(consoles):
+    def __init__(self, net):
+        self.net = net
+        self.hosts = net.hosts
+        self.buffers = dict((node, OutputBuffer()) for node in self.hosts)
+        self.timers = []
+        self.timerCount = 0
+        self.iperf = IperfAggregator()
+        self.bars = 0
+        self.csv = None
+        if graph_csv is not None:
+            self.csv = GraphLog(graph_csv)
+
+        self.initDaemons()
+
+        self.mux = OutputMux()
+        for node in self.hosts:
+            self.mux.register(node)
+        self.mux.start()
+        self.drainOutput()
+        self.after(iperf_interval_ms, self.flushBandwidth)
+
+    def after(self, ms, fn):
+        "Call fn in ms milliseconds."
+        self.timerCount += 1
+        heapq.heappush(self.timers, (time.time() + ms / 1000.0, self.timerCount, fn))
+
+    def tick(self):
+        "Run the timers that are due."
+        now = time.time()
+        while self.timers and self.timers[0][0] <= now:
+            heapq.heappop(self.timers)[2]()
+
+    def runFor(self, seconds):
+        "Keep running timers for seconds."
+        end = time.time() + seconds
+        while time.time() < end:
+            self.tick()
+            time.sleep(0.01)
+
+    def waitLaunched(self, timeout=None):
+        "Run timers until every queued launch and stop has settled."
+        end = None if timeout is None else time.time() + timeout
+        while ((self.launching or self.stopping) and
+               (end is None or time.time() < end)):
+            self.tick()
+            time.sleep(0.01)
+
+    def drainOutput(self):
+        "Keep the output read since the last call."
+        for node, chunks in self.mux.drain().items():
+            for data, _idle in chunks:
+                self.buffers[node].append(Console.ignoreChars.sub('', data))
+                self.updateGraph(node, data)
+        self.after(drain_ms, self.drainOutput)
+
+    def updateGraph(self, node, output):
+        "Hand iperf output of node to the aggregator."
+        self.iperf.feed(node, output)
+
+    def flushBandwidth(self):
+        "Print the bandwidth of the hosts that reported since the last time."
+        bar = self.iperf.flush()
+        if bar is not None:
+            print('bandwidth: ' + formatBar(bar))
+            if self.csv is not None:
+                self.csv.write(self.bars, bar.time, bar.sum)
+            self.bars += 1
+        self.after(iperf_interval_ms, self.flushBandwidth)
+
+    def sendToHost(self, i, cmd):
+        "Send cmd to host i unless it is busy."
+        return self.mux.send(self.hosts[i - start], cmd)
+
+    def output(self, i):
+        "Return the recent output of host i."
+        return self.buffers[self.hosts[i - start]].text()
+
+    def stop(self):
+        self.mux.stop()
+        if self.csv is not None:
+            self.csv.close()
+
+
+def intArg(line, default=None):
+    "Return the integer in line, or default if there is none."
+    line = line.strip()
+    if not line:
+        return default
+    return int(line)
+
+
+class HeadlessCLI(Cmd):
+    "Commands of the headless application, typed or read from a scenario."
+
+    prompt = 'vland> '
+
+    def __init__(self, app):
+        Cmd.__init__(self)
+        self.app = app
+
+    def emptyline(self):
+        pass
+
+    def do_launch(self, line):
+        "launch [N]: launch daemons up to host N, on every host by default"
+        self.app.launch(upto=intArg(line))
+
+    def do_add(self, line):
+        "add [N]: launch daemons on N more hosts, 10 by default"
+        self.app.launch(count=intArg(line, 10))
+
+    def do_reduce(self, _line):
+        "reduce: stop the daemons of the last 10 launched hosts"
+        self.app.debug_reduce_10()
+
+    def do_stop(self, _line):
+        "stop: stop every daemon"
+        self.app.stop_vland()
+
+    def do_stopwatch(self, _line):
+        "stopwatch: stop the daemons launched in watch mode"
+        self.app.stop_watch()
+
+    def do_watch(self, line):
+        "watch on|off: launch vlan watch instead of vland"
+        if line.strip() == 'on':
+            self.app.enable_watch()
+        else:
+            self.app.disable_watch()
+
+    def do_status(self, _line):
+        "status: show the state of the daemons"
+        self.app.status()
+
+    def do_probe(self, line):
+        "probe on|off: probe the overlay mesh of the hosts launched from now on"
+        if line.strip() == 'off':
+            self.app.stopProbe()
+        else:
+            self.app.startProbe()
+
+    def do_traffic(self, line):
+        "traffic [PATTERN [N]]: run iperf between hosts: all-to-one, ring, permutation or N pairs"
+        args = line.split()
+        if args and args[0] not in trafficPatterns:
+            print('*** unknown pattern: ' + args[0])
             return
-	global number
-        i = start - 1
-        for console in consoles:
-            i += 1
-	    if i > number and i <= 150 :
-		number = i
-		s = 'i: ' + str(i) + ' ............'
-		print(s)
-
-		str_i='/etc/vlan_test/' + str(i)
-		global watch
-		if watch > 0 :
-	                console.sendCmd('nohup ' + local_program_path + '/vlan -c ' + str_i + ' --pidfile=' + str_i + '/vlan.pid watch --logfile=' + str_i + '/vlan.log -d 1 > /dev/null  2>&1 &')
-		else :
-	                console.sendCmd('nohup ' + local_program_path + '/vland -c ' + str_i + ' --pidfile=' + str_i + '/vlan.pid --logfile=' + str_i + '/vlan.log -d 1 > /dev/null  2>&1 &')
-
-	s = 'total: ' + str(number)
-	print(s)
-
-
-
-    def debug_all(self):
-        consoles = self.consoles['hosts'].consoles
-        if self.waiting(consoles):
+        self.app.startTraffic(args[0] if args else None,
+                              int(args[1]) if len(args) > 1 else None)
+
+    def do_mesh(self, _line):
+        "mesh: show how much of the overlay mesh was reachable"
+        probe = self.app.probe
+        if probe is None:
+            print('not probing')
             return
-	global number
-        i = start - 1
-        for console in consoles:
-            i += 1
-	    if i >= number :
-		number = i
-		s = 'i: ' + str(i) + ' ............'
-		print(s)
-
-		str_i='/etc/vlan_test/' + str(i)
-		global watch
-		if watch > 0 :
-	                console.sendCmd('nohup ' + local_program_path + '/vlan -c ' + str_i + ' --pidfile=' + str_i + '/vlan.pid watch --logfile=' + str_i + '/vlan.log -d 1 > /dev/null  2>&1 &')
-		else :
-	                console.sendCmd('nohup ' + local_program_path + '/vland -c ' + str_i + ' --pidfile=' + str_i + '/vlan.pid --logfile=' + str_i + '/vlan.log -d 1 > /dev/null  2>&1 &')
-
-	s = 'total: ' + str(number)
-	print(s)
-
-    def debug_Add_10(self):
-        consoles = self.consoles['hosts'].consoles
-        if self.waiting(consoles):
+        print('%d hosts, %.1f%% of pairs reachable, %d joined' %
+              (len(probe.hosts), 100 * probe.coverage(), len(probe.joined)))
+        for step in probe.steps:
+            print(step)
+
+    def do_resources(self, _line):
+        "resources: show the last resource sample of the daemons"
+        if self.app.resources is not None:
+            print(formatResources(self.app.resources))
+
+    def do_logs(self, _line):
+        "logs: show the error, reconnect and crash counts of the daemon logs"
+        tailer = self.app.tailer
+        for i in sorted(tailer.counts):
+            print('%5d %s' % (i, formatCounts(tailer.counts[i])))
+        print('total %s' % formatCounts(tailer.totals()))
+
+    def do_board(self, _line):
+        "board: show the state, resource use and last log line of every host"
+        print(statusHeader)
+        print('\n'.join(self.app.statusTable()))
+
+    def do_wait(self, line):
+        "wait [SECONDS]: wait until every launch and stop has settled"
+        self.app.waitLaunched(intArg(line))
+
+    def do_sleep(self, line):
+        "sleep SECONDS: keep running for a while"
+        self.app.runFor(float(line))
+
+    def do_output(self, line):
+        "output N: show the recent output of host N"
+        i = intArg(line)
+        if i is None or not 1 <= i <= servers + clients:
+            print('*** output needs a host from 1 to %d' % (servers + clients))
             return
-	global number
-	end = number + 10
-        i = start - 1
-        for console in consoles:
-            i += 1
-	    if i > number and i <= end:
-		number = i
-		s = 'i: ' + str(i) + ' ............'
-		print(s)
-		str_i='/etc/vlan_test/' + str(i)
-		global watch
-		if watch > 0 :
-	                console.sendCmd('nohup ' + local_program_path + '/vlan -c ' + str_i + ' --pidfile=' + str_i + '/vlan.pid watch --logfile=' + str_i + '/vlan.log -d 1 > /dev/null  2>&1 &')
-		else :
-	                console.sendCmd('nohup ' + local_program_path + '/vland -c ' + str_i + ' --pidfile=' + str_i + '/vlan.pid --logfile=' + str_i + '/vlan.log -d 1 > /dev/null  2>&1 &')
-
-	s = 'total: ' + str(number)
-	print(s)
-
-
-    def debug_reduce_10(self):
-        consoles = self.consoles['hosts'].consoles
-        if self.waiting(consoles) or number <= 0 :
-            print('Already is 0')
+        print(self.app.output(i))
+
+    def do_quit(self, _line):
+        "quit: leave"
+        return True
+
+    do_EOF = do_quit
+
+    def onecmd(self, line):
+        try:
+            return Cmd.onecmd(self, line)
+        except (ValueError, IndexError) as e:
+            print('*** ' + str(e))
+            return False
+
+
+def runHeadless(app, script=None):
+    "Run commands from the scenario file script, or from stdin."
+    cli = HeadlessCLI(app)
+    if script is not None:
+        f = open(script)
+        lines = f.readlines()
+        f.close()
+        for line in lines:
+            line = line.split('#')[0].strip()
+            if not line:
+                continue
+            print(cli.prompt + line)
+            if cli.onecmd(line):
+                return
+            app.tick()
+        return
+    sys.stdout.write(cli.prompt)
+    sys.stdout.flush()
+    while True:
+        ready = select.select([sys.stdin], [], [], 0.05)[0]
+        app.tick()
+        if not ready:
+            continue
+        line = sys.stdin.readline()
+        if not line or cli.onecmd(line.strip()):
             return
-	global number
-	if number >= 10 :
-		end = number - 10
-	else :
-		end = 0
-        i = start - 1
-        for console in consoles:
-            i += 1
-	    if i > end and i <= number:
-		str_i='/etc/vlan_test/' + str(i)
-		s = 'i: ' + str(i) + ' ............'
-		print(s)
-		result = commands.getoutput('ps -ef | grep vlan | grep -v vland | grep -v grep | grep \" /etc/vlan_test/' + str(i) + '\ " | awk \'{print $2;}\'')
-		for str_ in result.split() :
-#			print(str_)
-			console.sendCmd('kill ' + str_)
-			console.sendCmd('kill -9 ' + str_)
-
-		result = commands.getoutput('ps -ef | grep vland | grep -v grep | grep \" /etc/vlan_test/' + str(i) + '\ " | awk \'{print $2;}\'')
-		for str_ in result.split() :
-#			print(str_)
-			commands.getoutput(local_program_path + '/vlan -c ' + str_i + ' --pidfile=' + str_i + '/vlan.pid stop; kill ' + str_ + '; kill -9 ' + str_)
-
-	number = end
-	s = 'total: ' + str(number)
-	print(s)
-
-
+        sys.stdout.write(cli.prompt)
+        sys.stdout.flush()
+
+
+def timed(phases, name, fn, *args):
+    "Call fn(*args), adding (name, seconds) to phases; return its result."
+    begin = time.time()
+    result = fn(*args)
+    phases.append((name, time.time() - begin))
+    print('%s: %.2fs' % (name, phases[-1][1]))
+    return result
+
+
+def reportPhases(title, phases):
+    "Print the time of each phase and the total."
+    print('%s in %.2fs: %s' % (title, sum(t for _name, t in phases),
+                               ', '.join('%s %.2fs' % phase for phase in phases)))
+
+
+def parallel(fn, items, workers=None):
+    "Return [fn(item) for item in items], called from at most workers threads."
+    items = list(items)
+    if workers is None:
+        workers = bringup_workers
+    if len(items) < 2 or workers < 2:
+        return [fn(item) for item in items]
+    pool = ThreadPool(min(workers, len(items)))
+    try:
+        return pool.map(fn, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def createNodes(net, specs, nodes):
+    "Create the nodes of (cls, name, params) specs in parallel, adding them in order."
+    for node in parallel(lambda spec: spec[0](spec[1], **spec[2]), specs):
+        nodes.append(node)
+        net.nameToNode[node.name] = node
+
+
+def linkGroups(net, links):
+    """Split link params into a list of links between switches and lists of
+       the other links by switch. Setting up a link runs commands in the
+       shell of its switch, so only links of different switches can be
+       set up at the same time."""
+    trunks = []
+    groups = {}
+    for params in links:
+        switches = [name for name in (params['node1'], params['node2'])
+                    if net[name] in net.switches]
+        if len(switches) != 1:
+            trunks.append(params)
+        else:
+            groups.setdefault(switches[0], []).append(params)
+    return trunks, [groups[name] for name in sorted(groups)]
+
+
+def bringUp(topo):
+    """Create and start the network of topo phase by phase, creating nodes
+       and links from parallel threads. Returns the started network."""
+    phases = []
+    timed(phases, 'cleanup', os.system, 'mn -c')
+    opts = {}
+    if topo_layout == 'leafspine':
+        # Standalone STP switches, a controller would flood the loops
+        opts['controller'] = None
+    net = Mininet(topo=None, build=False, **opts)
+    if not opts:
+        net.addController('c0')
+
+    def addSwitches():
+        specs = []
+        for name in topo.switches():
+            params = dict(topo.nodeInfo(name))
+            cls = params.pop('cls', None) or net.switch
+            params.setdefault('inNamespace', net.inNamespace)
+            if net.listenPort:
+                params.setdefault('listenPort', net.listenPort)
+                if not net.inNamespace:
+                    net.listenPort += 1
+            specs.append((cls, name, params))
+        createNodes(net, specs, net.switches)
+
+    def addHosts():
+        specs = []
+        for name in topo.hosts():
+            params = dict(topo.nodeInfo(name))
+            specs.append((params.pop('cls', None) or net.host, name, params))
+            net.nextIP += 1
+        createNodes(net, specs, net.hosts)
+
+    def addLinks():
+        trunks, groups = linkGroups(net, [params for _src, _dst, params in
+                                          topo.links(sort=True, withInfo=True)])
+        for params in trunks:
+            net.addLink(**params)
+        parallel(lambda group: [net.addLink(**params) for params in group], groups)
+
+    def configHosts():
+        parallel(lambda host: host.configDefault(), net.hosts)
+        net.built = True
+
+    timed(phases, 'switches', addSwitches)
+    timed(phases, 'hosts', addHosts)
+    timed(phases, 'links', addLinks)
+    timed(phases, 'host config', configHosts)
+    # Add NAT connectivity
+    timed(phases, 'nat', lambda: net.addNAT().configDefault())
+    # start() configures the switches with one batchStartup() per class
+    timed(phases, 'switch start', net.start)
+    reportPhases('network up', phases)
+    return net
+
+
+def tearDown(net):
+    "Stop net like Mininet.stop(), phase by phase, in parallel where it can."
+    phases = []
+
+    def stopControllers():
+        if net.terms:
+            net.stopXterms()
+        for controller in net.controllers:
+            controller.stop()
+
+    def stopSwitches():
+        stopped = set()
+        for cls in set(type(switch) for switch in net.switches):
+            if hasattr(cls, 'batchShutdown'):
+                stopped.update(cls.batchShutdown(
+                    [s for s in net.switches if type(s) is cls]) or [])
+        for switch in net.switches:
+            if switch not in stopped:
+                switch.stop()
+            switch.terminate()
+
+    def stopLinks():
+        trunks, groups = linkGroups(net, [{'node1': link.intf1.node.name,
+                                           'node2': link.intf2.node.name,
+                                           'link': link} for link in net.links])
+        for params in trunks:
+            params['link'].stop()
+        parallel(lambda group: [params['link'].stop() for params in group], groups)
+
+    timed(phases, 'controllers', stopControllers)
+    timed(phases, 'switches', stopSwitches)
+    timed(phases, 'links', stopLinks)
+    timed(phases, 'hosts', parallel, lambda host: host.terminate(), net.hosts)
+    reportPhases('network down', phases)
 
 
 # Make it easier to construct and assign objects
@@ -768,18 +2715,82 @@ class Object(object):
 
 
 if __name__ == '__main__':
-    import os
+    parser = ArgumentParser(description='Run vland daemons on a Mininet network.')
+    parser.add_argument('--headless', action='store_true',
+                        help='no consoles, read commands from stdin')
+    parser.add_argument('--script', metavar='FILE',
+                        help='run the headless commands in FILE')
+    parser.add_argument('--graph-csv', metavar='FILE',
+                        help='append every bandwidth bar to FILE')
+    parser.add_argument('--resource-log', metavar='FILE',
+                        help='log daemon resource samples to FILE '
+                        '(CSV, or JSON lines for *.json)')
+    parser.add_argument('--event-log', metavar='FILE',
+                        help='log daemon log line counts and crashes to FILE '
+                        'as JSON lines')
+    parser.add_argument('--topo', choices=['single', 'tree', 'leafspine'],
+                        default=topo_layout, help='how the hosts are switched')
+    parser.add_argument('--fanout', type=int, default=topo_fanout,
+                        help='hosts per edge switch, children per tree switch')
+    parser.add_argument('--spines', type=int, default=topo_spines,
+                        help='spine switches of a leafspine topology')
+    parser.add_argument('--host-link', type=parseLinkOpts, default={},
+                        metavar='OPTS', help='TCLink options of host links, '
+                        'e.g. bw=100,delay=5ms,loss=1')
+    parser.add_argument('--switch-link', type=parseLinkOpts, default={},
+                        metavar='OPTS', help='TCLink options of switch links')
+    parser.add_argument('--probe', action='store_true',
+                        help='probe the overlay mesh as daemons are launched')
+    parser.add_argument('--probe-results', metavar='FILE', default=probe_results,
+                        help='where the mesh probe results are saved')
+    parser.add_argument('--traffic', choices=sorted(trafficPatterns),
+                        default=traffic_pattern,
+                        help='traffic pattern of the Traffic button')
+    parser.add_argument('--traffic-pairs', type=int, default=traffic_pairs,
+                        help='pairs of the pairs pattern')
+    parser.add_argument('--traffic-duration', type=int, default=traffic_duration,
+                        help='seconds of traffic per client')
+    parser.add_argument('--traffic-streams', type=int, default=traffic_streams,
+                        help='parallel streams per client')
+    parser.add_argument('--traffic-stagger', type=float, default=traffic_stagger,
+                        help='seconds between client starts')
+    parser.add_argument('--traffic-results', metavar='FILE',
+                        default=traffic_results,
+                        help='where the traffic results are saved')
+    args = parser.parse_args()
+    traffic_pattern, traffic_pairs = args.traffic, args.traffic_pairs
+    traffic_duration, traffic_streams = args.traffic_duration, args.traffic_streams
+    traffic_stagger, traffic_results = args.traffic_stagger, args.traffic_results
+    probe_results = args.probe_results
+    topo_layout, topo_fanout, topo_spines = args.topo, args.fanout, args.spines
+    host_link, switch_link = args.host_link, args.switch_link
+    graph_csv = args.graph_csv
+    resource_log = args.resource_log
+    event_log = args.event_log
 
-    os.system('mn -c')
     setLogLevel('info')
-    network = Mininet(MyTopo())
-
-    network.addNAT().configDefault()
-    network.start()
-    app = ConsoleApp(network, width=4)
-    # Add NAT connectivity
-
-    app.mainloop()
-
-    network.stop()
+    network = bringUp(MyTopo())
+    try:
+        if args.headless or args.script:
+            app = HeadlessApp(network)
+            try:
+                if args.probe:
+                    app.startProbe()
+                runHeadless(app, args.script)
+            finally:
+                app.stopTraffic()
+                app.stopProbe()
+                app.stop()
+        else:
+            app = ConsoleApp(network, width=4)
+            try:
+                if args.probe:
+                    app.startProbe()
+                app.mainloop()
+            finally:
+                app.stopTraffic()
+                app.stopProbe()
+                app.mux.stop()
+    finally:
+        tearDown(network)
 
@@ -1,13 +1,62 @@
 #!/usr/bin/python
 
 import os
-import threading
+import argparse
+import contextlib
+import hashlib
+import heapq
+import json
+import multiprocessing
+import random
+import shutil
+import socket
+import struct
+import subprocess
+import time
+
+try:
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+except ImportError:
+    rsa = None
 
 # if 0 == servers:
 # ues remote tinc proxy
 servers = 8
 clients = 16
 need_start_sh = True
+conf_root = "/etc/tinc"
+# keep the existing tree and only rewrite files whose content changed
+incremental = False
+# how node directories share host entries: "hard", "symlink" or "copy"
+host_links = "hard"
+tincd_old = "/usr/local/sbin/tincd_old"
+# ConnectTo layout of the server mesh: "full", "ring", "nearest", "random" or "tree"
+topology = "full"
+# most ConnectTo lines per server for every layout but "full"
+max_degree = 6
+topology_seed = 0
+# how clients are spread over the servers: "block", "round-robin",
+# "least-loaded" or "weighted"
+client_assignment = "block"
+# relative client capacity by server index for "weighted", default 1
+server_weights = {}
+# node i gets host i of each pool: the Mininet address its tinc
+# host entry points to, and the address of its tinc interface
+underlay_pool = "10.0.0.0/8"
+overlay_pool = "10.1.0.0/16"
+# node i listens on the i-th port of this range
+port_range = (12301, 65535)
+# number of key generation workers, 0 means one per CPU
+keygen_workers = 0
+# key generation backend: "python", "openssl" or "auto"
+key_backend = "auto"
+key_bits = 2048
+# generated key pairs are kept here across runs, indexed by node name
+keystore_dir = "/etc/tinc-keystore"
+# True regenerates every key, a collection of node names only those
+rotate_keys = False
 
 remote_server_host = "\
 Address=58.20.63.23\n\
@@ -24,144 +73,795 @@ XQIDAQAB\n\
 "
 
 
-def creat_conf():
-    copy_server_pubkey()
+def conf_path(*parts):
+    "Return the path of parts below the configuration root."
+    return os.path.join(conf_root, *parts)
 
-    thread_pool = []
 
-    for i in range(1, servers + clients + 1):
-        s = str(i)
+# (server, slot) of every client node, filled by assign_clients()
+client_slots = {}
+# (underlay, overlay, port) of every node, filled by allocate_addresses()
+node_addresses = {}
+
+
+def node_name(i):
+    "Return the tinc name of node i."
+    if i <= servers:
+        return "vpnserver_" + str(i)
+    server, slot = client_slots[i]
+    return "c_" + str(server) + "_" + str(slot)
+
+
+def client_server(i):
+    "Return the host entry name of the server client i connects to."
+    if 0 == servers:
+        return "vpnserver"
+    return "vpnserver_" + str(client_slots[i][0])
+
+
+def ip_to_int(ip):
+    return struct.unpack("!I", socket.inet_aton(ip))[0]
+
+
+def int_to_ip(value):
+    return socket.inet_ntoa(struct.pack("!I", value))
+
+
+class AddressPool(object):
+    "Host addresses of a CIDR block, numbered from 1."
+
+    def __init__(self, cidr):
+        ip, prefix = cidr.split("/")
+        self.prefix = int(prefix)
+        self.mask = (0xffffffff << (32 - self.prefix)) & 0xffffffff
+        self.network = ip_to_int(ip) & self.mask
+        self.size = 1 << (32 - self.prefix)
+        self.cidr = int_to_ip(self.network) + "/" + str(self.prefix)
+        self.netmask = int_to_ip(self.mask)
+
+    def address(self, n):
+        "Return the n-th host address of the pool."
+        if n < 1 or n >= self.size - 1:
+            raise ValueError("%s has no host address %d" % (self.cidr, n))
+        return int_to_ip(self.network + n)
+
+
+def allocate_addresses(nodes):
+    "Give every node its addresses and port, refusing any collision."
+    node_addresses.clear()
+    underlay = AddressPool(underlay_pool)
+    overlay = AddressPool(overlay_pool)
+    if len(nodes) > port_range[1] - port_range[0] + 1:
+        raise ValueError("port range %d-%d is too small for %d nodes" %
+                         (port_range[0], port_range[1], len(nodes)))
+    used = {}
+    for i in nodes:
+        addresses = (underlay.address(i), overlay.address(i), port_range[0] + i - 1)
+        for address in addresses[:2]:
+            if address in used:
+                raise ValueError("address %s is used by node %d and node %d" % (address, used[address], i))
+            used[address] = i
+        node_addresses[i] = addresses
+    return underlay, overlay
+
+
+class ConfWriter(object):
+    "Write files atomically, skipping those whose content did not change."
+
+    def __init__(self, incremental=True):
+        self.incremental = incremental
+        self.paths = set()
+        self.written = 0
+        self.linked = 0
+        self.skipped = 0
+        self.removed = 0
+        self.bytes = 0
+        self.phases = []
+
+    def write(self, path, content, mode=None):
+        "Write content to path unless it already holds it."
+        self.paths.add(path)
+        if self.incremental and file_digest(path) == content_digest(content):
+            if mode is not None and os.stat(path).st_mode & 0o7777 != mode:
+                os.chmod(path, mode)
+            self.skipped += 1
+            return False
+        tmp = path + ".tmp"
+        f = open(tmp, "w")
+        f.write(content)
+        f.close()
+        if mode is not None:
+            os.chmod(tmp, mode)
+        os.rename(tmp, path)
+        self.written += 1
+        self.bytes += len(content)
+        return True
+
+    def link(self, path, source, symbolic=False):
+        "Make path a link to source, falling back to a copy."
+        self.paths.add(path)
+        target = source
+        if symbolic:
+            target = os.path.relpath(source, os.path.dirname(path))
+        if self.incremental and os.path.lexists(path):
+            if symbolic:
+                if os.path.islink(path) and os.readlink(path) == target:
+                    self.skipped += 1
+                    return False
+            elif not os.path.islink(path) and (
+                    os.path.samefile(path, source) or
+                    file_digest(path) == file_digest(source)):
+                self.skipped += 1
+                return False
+        tmp = path + ".tmp"
+        if os.path.lexists(tmp):
+            os.remove(tmp)
         try:
-            os.mkdir("/etc/tinc/" + s)
-        except:
-            pass
+            if symbolic:
+                os.symlink(target, tmp)
+            else:
+                os.link(source, tmp)
+            self.linked += 1
+        except OSError:
+            shutil.copy2(source, tmp)
+            self.bytes += os.path.getsize(tmp)
+        os.rename(tmp, path)
+        self.written += 1
+        return True
+
+    def remove(self, path):
+        "Remove a stale file or directory tree."
+        if os.path.isdir(path) and not os.path.islink(path):
+            for _, _, files in os.walk(path):
+                self.removed += len(files)
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+            self.removed += 1
+
+    def prune(self, directory):
+        "Remove the files of directory this writer did not produce."
         try:
-            os.mkdir("/etc/tinc/" + s + "/hosts")
-        except:
-            pass
-        for j in range(0, 5):
-            msg = ""
-            if j == 0:
-		if i <= servers:
-                	f = open("/etc/tinc/" + s + "/hosts/vpnserver_" + s, "w+")
-		else :
-                	f = open("/etc/tinc/" + s + "/hosts/c_" + str((int(s)-7)/2) + "_" + str((int(s)-7)%2 + 1) , "w+")
-                msg = "Address=10.0.0." + s + "\n" + \
-                    "PrivateKeyFile = /etc/tinc/" + s + "/rsa_key.priv \n" + \
-                    "PublicKeyFile = /etc/tinc/" + s + "/rsa_key.pub"
-            elif j == 1:
-                f = open("/etc/tinc/" + s + "/nets.boot", "w+")
-                msg = "## This file contains all names of the networks to be started on system startup.\ntest"
-
-            elif j == 2:
-                f = open("/etc/tinc/" + s + "/tinc.conf", "w+")
-                if i <= servers:
- 		    msg = "Name = vpnserver_" + s
-                    msg += "\nDevice = /dev/net/tun\nMode = switch"
-                    for k in range(1, servers + 1):
-                        msg += "\nConnectTo = vpnserver_" + str(k)
-
-                    	if 0 == servers:
-                        	msg += "\nConnectTo = vpnserver"
-
-                else:
-		    msg = "Name = c_" + str((int(s)-7)/2) + "_" + str((int(s)-7)%2 + 1) + "\nDevice = /dev/net/tun\nMode = switch"
-                    #for k in range(1, servers + 1):
-                    msg += "\nConnectTo = vpnserver"
-		msg += "\nPort = " + str(i + 12300)
-
-            elif j == 3:
-                f = open("/etc/tinc/" + s + "/tinc-down", "w+")
-                msg = "ifconfig $INTERFACE down"
-            elif j == 4:
-                f = open("/etc/tinc/" + s + "/tinc-up", "w+")
-                msg = "ifconfig $INTERFACE 10.1.0." + s + " netmask 255.255.0.0\n" + \
-                    "route add -host 10.255.255.254 dev $INTERFACE\n" + \
-                    "echo 1 > /proc/sys/net/ipv4/ip_forward\n" + \
-                    "iptables -t nat -F\n" + \
-                    "iptables -t nat -A POSTROUTING -s 10.1.0.0/24 -o h" + s + "-eth0 -j MASQUERADE"
-            f.write(msg)
-            f.close()
-
-	f = open("/etc/tinc/" + s + "/s", "w+")
-        msg = "tinc -c . --pidfile=tinc.pid $*\n"
-	f.write(msg)
-        f.close()
+            entries = os.listdir(directory)
+        except OSError:
+            return
+        for entry in entries:
+            path = os.path.join(directory, entry)
+            if path not in self.paths:
+                self.remove(path)
 
-        os.chmod("/etc/tinc/" + s + "/s", 777)
-        os.chmod("/etc/tinc/" + s + "/tinc-up", 777)
-        os.chmod("/etc/tinc/" + s + "/tinc-down", 777)
-        handle = threading.Thread(target=create_host_pubkey, args=(s, ))
-        handle.start()
-        thread_pool.append(handle)
+    @contextlib.contextmanager
+    def phase(self, name):
+        "Record the cost of the work done in a named phase."
+        before = self.counters()
+        yield
+        after = self.counters()
+        self.phases.append((name, dict((k, after[k] - before[k]) for k in after)))
 
-    for i in range(1, servers + clients + 1):
-        s = str(i)
-        if need_start_sh:
-            f = open("/etc/tinc/" + s + "/start", "w+")
-	    if i <= servers:
-                msg = "#!/bin/bash\n" + "tincd -c /etc/tinc/" + s + " --pidfile /etc/tinc/" + s + "/tinc.pid -D -d 1"
-	    else :
-                msg = "#!/bin/bash\n" + "sudo /etc/tinc/" + s  + "/tincd -c /etc/tinc/" + s + " --pidfile /etc/tinc/" + s + "/tinc.pid -D -d 1"	
-                os.system("cp /usr/local/sbin/tincd_old /etc/tinc/" + s + "/tincd")
-            f.write(msg)
-            f.close()
-            os.system("chmod 0755 /etc/tinc/" + s + "/start")
+    def counters(self):
+        times = os.times()
+        return {
+            "wall": time.time(),
+            "cpu": sum(times[:4]),
+            "files": self.written,
+            "bytes": self.bytes,
+            "forks": forks_since_boot()
+        }
 
+    def report(self):
+        for name, cost in self.phases:
+            print("%-11s %7.2fs wall %7.2fs cpu %7d files %9d bytes %5d forks" %
+                  (name, cost["wall"], cost["cpu"], cost["files"], cost["bytes"], cost["forks"]))
+        print("wrote %d files (%d linked), skipped %d unchanged, removed %d" %
+              (self.written, self.linked, self.skipped, self.removed))
+
+
+def forks_since_boot():
+    "Return the number of processes forked on the system since boot."
+    try:
+        f = open("/proc/stat", "r")
+    except IOError:
+        return 0
+    count = 0
+    for line in f:
+        if line.startswith("processes "):
+            count = int(line.split()[1])
+    f.close()
+    return count
+
+
+def content_digest(content):
+    return hashlib.sha1(content).hexdigest()
+
+
+def file_digest(path):
+    "Return the content hash of path, or None if it cannot be read."
+    try:
+        f = open(path, "r")
+    except IOError:
+        return None
+    digest = hashlib.sha1(f.read()).hexdigest()
+    f.close()
+    return digest
+
+
+def creat_conf(writer=None):
+    "Render the tinc configuration of every node and write it under conf_root."
+    if writer is None:
+        writer = ConfWriter(incremental)
+    nodes = range(1, servers + clients + 1)
+
+    with writer.phase("directories"):
+        make_conf_dirs(nodes)
+    with writer.phase("render"):
+        entries = copy_server_pubkey(writer)
+        peers = connect_servers(servers)
+        assign_clients(peers)
+        _, overlay = allocate_addresses(nodes)
+        for i in nodes:
+            render_node_conf(writer, i, overlay, peers.get(i))
+    with writer.phase("keys"):
+        entries.update(generate_host_keys(writer, [str(i) for i in nodes]))
+    with writer.phase("hosts"):
+        distribute_hosts(writer, nodes, entries)
+        if writer.incremental:
+            prune_conf(writer, nodes)
+    writer.report()
+    return writer
+
+
+def make_conf_dirs(nodes):
+    "Create the missing node directories, listing conf_root only once."
+    if not os.path.isdir(conf_root):
+        os.makedirs(conf_root)
+    existing = set(os.listdir(conf_root))
+    if "hosts" not in existing:
+        os.mkdir(conf_path("hosts"))
+    for i in nodes:
+        if str(i) not in existing:
+            os.mkdir(conf_path(str(i)))
+            os.mkdir(conf_path(str(i), "hosts"))
+        elif not os.path.isdir(conf_path(str(i), "hosts")):
+            os.mkdir(conf_path(str(i), "hosts"))
+
+
+def connect_full(n):
+    "Every server connects to every server."
+    return dict((i, range(1, n + 1)) for i in range(1, n + 1))
+
+
+def connect_ring(n):
+    "A ring with chords at power of two distances while the degree allows."
+    edges = set()
+    distance = 1
+    degree = 2
+    while distance <= n // 2 and degree <= max_degree:
+        for i in range(n):
+            add_edge(edges, i + 1, (i + distance) % n + 1)
+        distance *= 2
+        degree += 2
+    return edges
+
+
+def connect_nearest(n):
+    "Every server connects to the max_degree / 2 servers on each side of it."
+    edges = set()
+    for distance in range(1, max_degree // 2 + 1):
+        for i in range(n):
+            add_edge(edges, i + 1, (i + distance) % n + 1)
+    return edges
+
+
+def connect_random(n):
+    "A ring plus random links up to max_degree per server."
+    edges = set()
+    for i in range(n):
+        add_edge(edges, i + 1, (i + 1) % n + 1)
+    degree = edge_degrees(edges)
+    rng = random.Random(topology_seed)
+    for i in range(1, n + 1):
+        for _ in range(4 * max_degree):
+            if degree.get(i, 0) >= max_degree:
+                break
+            j = rng.randint(1, n)
+            if j == i or (min(i, j), max(i, j)) in edges or degree.get(j, 0) >= max_degree:
+                continue
+            add_edge(edges, i, j)
+            degree[i] = degree.get(i, 0) + 1
+            degree[j] = degree.get(j, 0) + 1
+    return edges
+
+
+def connect_tree(n):
+    "A tree in which every server has max_degree - 1 children."
+    edges = set()
+    fanout = max_degree - 1
+    for i in range(2, n + 1):
+        add_edge(edges, i, (i - 2) // fanout + 1)
+    return edges
+
+
+def add_edge(edges, i, j):
+    if i != j:
+        edges.add((min(i, j), max(i, j)))
+
+
+def edge_degrees(edges):
+    degree = {}
+    for i, j in edges:
+        degree[i] = degree.get(i, 0) + 1
+        degree[j] = degree.get(j, 0) + 1
+    return degree
+
+
+topologies = {
+    "full": connect_full,
+    "ring": connect_ring,
+    "nearest": connect_nearest,
+    "random": connect_random,
+    "tree": connect_tree
+}
+
+
+def connect_servers(n):
+    "Return the servers each of the n servers connects to."
+    if topology not in topologies:
+        raise ValueError("unknown topology " + topology)
+    if topology != "full" and max_degree < 2:
+        raise ValueError("max_degree must be at least 2")
+    edges = topologies[topology](n)
+    if topology == "full":
+        return edges
+    peers = dict((i, []) for i in range(1, n + 1))
+    for i, j in sorted(edges):
+        peers[i].append(j)
+        peers[j].append(i)
+    check_topology(peers)
+    print("topology %s: %d servers, %d connections, max degree %d" %
+          (topology, n, len(edges), max([len(p) for p in peers.values()] + [0])))
+    return peers
+
+
+def check_topology(peers):
+    "Make sure the server graph is connected and within max_degree."
+    for i in peers:
+        if len(peers[i]) > max_degree:
+            raise RuntimeError("server %d has %d connections" % (i, len(peers[i])))
+    if not peers:
+        return
+    seen = set([1])
+    todo = [1]
+    while todo:
+        for j in peers[todo.pop()]:
+            if j not in seen:
+                seen.add(j)
+                todo.append(j)
+    if len(seen) != len(peers):
+        raise RuntimeError("the %s topology is not connected" % topology)
+
+
+def assign_block(n, loads):
+    "Contiguous runs of clients per server, the historical layout."
+    per = -(-n // len(loads))
+    return [j // per + 1 for j in range(n)]
+
+
+def assign_round_robin(n, loads):
+    "Deal clients to the servers in turn."
+    return [j % len(loads) + 1 for j in range(n)]
+
+
+def assign_least_loaded(n, loads):
+    "Give each client to the server with the fewest connections so far."
+    return assign_by_heap(n, loads, [1] * len(loads))
+
+
+def assign_weighted(n, loads):
+    "Spread clients in proportion to server_weights."
+    weights = [server_weights.get(k, 1) for k in range(1, len(loads) + 1)]
+    if not [w for w in weights if w > 0]:
+        raise ValueError("every server weight is 0")
+    return assign_by_heap(n, [0] * len(loads), weights)
+
+
+def assign_by_heap(n, loads, weights):
+    "Repeatedly pick the server with the lowest load relative to its weight."
+    heap = [(float(loads[k] + 1) / weights[k], k + 1, loads[k])
+            for k in range(len(loads)) if weights[k] > 0]
+    heapq.heapify(heap)
+    result = []
+    for _ in range(n):
+        _, server, load = heapq.heappop(heap)
+        result.append(server)
+        load += 1
+        heapq.heappush(heap, (float(load + 1) / weights[server - 1], server, load))
+    return result
+
+
+client_assignments = {
+    "block": assign_block,
+    "round-robin": assign_round_robin,
+    "least-loaded": assign_least_loaded,
+    "weighted": assign_weighted
+}
+
+
+def assign_clients(peers):
+    "Map every client node onto a server and a slot on that server."
+    client_slots.clear()
+    if client_assignment not in client_assignments:
+        raise ValueError("unknown client assignment " + client_assignment)
+    if 0 == servers:
+        for j in range(clients):
+            client_slots[servers + j + 1] = (0, j + 1)
+        return
+    # servers already busy with meta connections count as loaded
+    loads = [len(peers[k]) if topology != "full" else 0
+             for k in range(1, servers + 1)]
+    carried = [0] * (servers + 1)
+    for j, server in enumerate(client_assignments[client_assignment](clients, loads)):
+        carried[server] += 1
+        client_slots[servers + j + 1] = (server, carried[server])
+    for k in range(1, servers + 1):
+        print("vpnserver_%d: %d clients" % (k, carried[k]))
+    print("clients per server (%s): min %d, max %d" %
+          (client_assignment, min(carried[1:]), max(carried[1:])))
+
+
+def render_node_conf(writer, i, overlay, peers=None):
+    "Write the configuration files of node i."
+    s = str(i)
+    writer.write(conf_path(s, "nets.boot"),
+                 "## This file contains all names of the networks to be started on system startup.\ntest")
+
+    msg = "Name = " + node_name(i) + "\nDevice = /dev/net/tun\nMode = switch"
+    if i <= servers:
+        for k in peers:
+            msg += "\nConnectTo = vpnserver_" + str(k)
+    else:
+        msg += "\nConnectTo = vpnserver"
+    msg += "\nPort = " + str(node_addresses[i][2])
+    writer.write(conf_path(s, "tinc.conf"), msg)
+
+    writer.write(conf_path(s, "tinc-down"), "ifconfig $INTERFACE down", 0o755)
+    msg = "ifconfig $INTERFACE " + node_addresses[i][1] + " netmask " + overlay.netmask + "\n" + \
+        "route add -host 10.255.255.254 dev $INTERFACE\n" + \
+        "echo 1 > /proc/sys/net/ipv4/ip_forward\n" + \
+        "iptables -t nat -F\n" + \
+        "iptables -t nat -A POSTROUTING -s " + overlay.cidr + " -o h" + s + "-eth0 -j MASQUERADE"
+    writer.write(conf_path(s, "tinc-up"), msg, 0o755)
+    writer.write(conf_path(s, "s"), "tinc -c . --pidfile=tinc.pid $*\n", 0o755)
+
+    if need_start_sh:
+        if i <= servers:
+            msg = "#!/bin/bash\n" + "tincd -c " + conf_path(s) + " --pidfile " + conf_path(s, "tinc.pid") + " -D -d 1"
+        else:
+            msg = "#!/bin/bash\n" + "sudo " + conf_path(s, "tincd") + " -c " + conf_path(s) + " --pidfile " + conf_path(s, "tinc.pid") + " -D -d 1"
+            if os.path.exists(tincd_old):
+                writer.link(conf_path(s, "tincd"), tincd_old)
+        writer.write(conf_path(s, "start"), msg, 0o755)
+
+
+def distribute_hosts(writer, nodes, entries):
+    "Give every node the host entries it needs: all of them for servers."
+    for i in nodes:
         s = str(i)
-        os.system("rm -rf /etc/tinc/" + s + "/hosts")
-
-    while True:
-        if len(thread_pool) == 0:
-            break
-        i = 0
-        for handle in thread_pool:
-            if not handle.isAlive():
-                thread_pool.pop(i)
-            i += 1
-
-    for i in range(1, servers + clients + 1):
-        s = str(i)
-	if i > servers :
-	    os.system("mkdir /etc/tinc/" + s + "/hosts")
-            os.system("cp /etc/tinc/hosts/c_" + str((i-7)/2) + "_" + str((i-7)%2 + 1) + " /etc/tinc/" + s + "/hosts")
-            os.system("cp /etc/tinc/hosts/vpnserver_" + str((i-7)/2) + " /etc/tinc/" + s + "/hosts/vpnserver")
-	else :
-            os.system("cp -rf /etc/tinc/hosts /etc/tinc/" + s + "/hosts")
+        if i > servers:
+            share_host(writer, entries, node_name(i), conf_path(s, "hosts", node_name(i)))
+            share_host(writer, entries, client_server(i), conf_path(s, "hosts", "vpnserver"))
+        else:
+            for name in sorted(entries):
+                share_host(writer, entries, name, conf_path(s, "hosts", name))
+
+
+def share_host(writer, entries, name, path):
+    "Place the host entry of name at path as configured by host_links."
+    if host_links == "copy":
+        writer.write(path, entries[name])
+    else:
+        writer.link(path, conf_path("hosts", name), host_links == "symlink")
+
+
+def prune_conf(writer, nodes):
+    "Remove host entries and node directories left over from a larger topology."
+    for entry in os.listdir(conf_root):
+        if entry.isdigit() and int(entry) > len(nodes):
+            writer.remove(conf_path(entry))
+    writer.prune(conf_path("hosts"))
+    for i in nodes:
+        writer.prune(conf_path(str(i), "hosts"))
 
 
 def clean_conf_dir():
-    os.system("rm -rf /etc/tinc/")
-    os.system("rm -rf /etc/tinc/hosts")
-    os.system("mkdir /etc/tinc/hosts -p")
+    shutil.rmtree(conf_root, ignore_errors=True)
+    os.makedirs(conf_path("hosts"))
 
 
-def copy_server_pubkey():
+def copy_server_pubkey(writer):
+    "Write the remote server host entry when there are no local servers."
+    entries = {}
     if 0 == servers:
-        f = open("/etc/tinc/hosts/vpnserver", "w+")
-        f.write(remote_server_host)
+        writer.write(conf_path("hosts", "vpnserver"), remote_server_host)
+        entries["vpnserver"] = remote_server_host
+    return entries
+
+
+def generate_host_keys(writer, nodes):
+    "Install the key pairs of nodes, generating missing ones in a pool of workers."
+    entries = {}
+    missing = []
+    for s in nodes:
+        keypair = None
+        if not must_rotate(node_name(int(s))):
+            keypair = load_keypair(node_name(int(s)))
+        if keypair is None:
+            missing.append(s)
+        else:
+            entries[node_name(int(s))] = install_keypair(writer, s, *keypair)
+    print("reused %d cached keys from %s" % (len(nodes) - len(missing), keystore_dir))
+    nodes = missing
+    if not nodes:
+        return entries
+    workers = min(keygen_workers or multiprocessing.cpu_count(), len(nodes))
+    print("generating %d keys with %d workers" % (len(nodes), workers))
+    print("key backend: " + resolve_key_backend())
+    begin = time.time()
+    pool = multiprocessing.Pool(workers)
+    try:
+        done = 0
+        for s, priv, pub, elapsed in pool.imap_unordered(create_host_pubkey, nodes):
+            done += 1
+            print("key %d/%d: node %s in %.2fs" % (done, len(nodes), s, elapsed))
+            store_keypair(node_name(int(s)), priv, pub)
+            entries[node_name(int(s))] = install_keypair(writer, s, priv, pub)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    print("generated %d keys in %.2fs" % (len(nodes), time.time() - begin))
+    return entries
+
+
+def python_keypair():
+    "Generate a key pair in memory, return the private and public PEM."
+    key = rsa.generate_private_key(public_exponent=65537, key_size=key_bits,
+                                   backend=default_backend())
+    priv = key.private_bytes(serialization.Encoding.PEM,
+                             serialization.PrivateFormat.TraditionalOpenSSL,
+                             serialization.NoEncryption())
+    pub = key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo)
+    return priv, pub
+
+
+def openssl_keypair():
+    "Generate a key pair with the openssl tool, return the private and public PEM."
+    devnull = open(os.devnull, "w")
+    genrsa = subprocess.Popen(["openssl", "genrsa", "-f4", str(key_bits)],
+                              stdout=subprocess.PIPE, stderr=devnull)
+    priv = genrsa.communicate()[0]
+    pubout = subprocess.Popen(["openssl", "rsa", "-pubout"],
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                              stderr=devnull)
+    pub = pubout.communicate(priv)[0]
+    devnull.close()
+    if genrsa.returncode or pubout.returncode:
+        raise RuntimeError("openssl failed to generate a key pair")
+    return priv, pub
+
+
+key_backends = {
+    "python": python_keypair,
+    "openssl": openssl_keypair
+}
+
+
+def resolve_key_backend():
+    "Return the name of the key generation backend to use."
+    if key_backend == "auto":
+        if rsa is not None:
+            return "python"
+        return "openssl"
+    if key_backend == "python" and rsa is None:
+        raise RuntimeError("the python key backend needs the cryptography package")
+    return key_backend
+
+
+def must_rotate(name):
+    "Should the cached key pair of name be replaced?"
+    if rotate_keys is True:
+        return True
+    return bool(rotate_keys) and name in rotate_keys
+
+
+def load_keypair(name):
+    """Return the cached private and public PEM of name, or None if there
+       is none or it is not a key_bits key."""
+    try:
+        f = open(os.path.join(keystore_dir, name + ".bits"), "r")
+        bits = f.read().strip()
+        f.close()
+        if bits != str(key_bits):
+            return None
+        f = open(os.path.join(keystore_dir, name + ".priv"), "r")
+        priv = f.read()
         f.close()
+        f = open(os.path.join(keystore_dir, name + ".pub"), "r")
+        pub = f.read()
+        f.close()
+    except IOError:
+        return None
+    if not priv or not pub:
+        return None
+    return priv, pub
+
+
+def store_keypair(name, priv, pub):
+    "Save the key pair of name in the keystore."
+    try:
+        os.makedirs(keystore_dir, 0o700)
+    except OSError:
+        pass
+    path = os.path.join(keystore_dir, name + ".priv")
+    f = open(path + ".tmp", "w")
+    f.write(priv)
+    f.close()
+    os.chmod(path + ".tmp", 0o600)
+    os.rename(path + ".tmp", path)
+    path = os.path.join(keystore_dir, name + ".pub")
+    f = open(path + ".tmp", "w")
+    f.write(pub)
+    f.close()
+    os.rename(path + ".tmp", path)
+    # The key size last, so a pair stored halfway is never reused
+    path = os.path.join(keystore_dir, name + ".bits")
+    f = open(path + ".tmp", "w")
+    f.write("%d\n" % key_bits)
+    f.close()
+    os.rename(path + ".tmp", path)
 
 
 def create_host_pubkey(s):
-    os.system("openssl genrsa -out /etc/tinc/" + s + "/rsa_key.priv -f4 2048")
-    os.system("openssl rsa -in /etc/tinc/" + s + "/rsa_key.priv -pubout -out /etc/tinc/" + s + "/rsa_key.pub")
+    "Generate the key pair of node s in a worker."
+    begin = time.time()
+    priv, pub = key_backends[resolve_key_backend()]()
+    return s, priv, pub, time.time() - begin
 
-    # get pub_key
-    f = open("/etc/tinc/" + s + "/rsa_key.pub", "r")
-    pubkey = f.read()
-    f.close()
 
+def install_keypair(writer, s, priv, pubkey):
+    "Write the key pair of node s and its host entry, return the entry."
+    writer.write(conf_path(s, "rsa_key.priv"), priv, 0o600)
+    writer.write(conf_path(s, "rsa_key.pub"), pubkey)
+
+    entry = pubkey
     if int(s) <= servers:
-        pubkey = "Address=10.0.0." + s + "\nPort =" + str(int(s) + 12300) + "\n" + pubkey
-    if int(s) <= servers :
-    	f = open("/etc/tinc/hosts/vpnserver_" + s, "w+")
-    else :
-    	f = open("/etc/tinc/hosts/c_" + str((int(s)-7)/2) + "_" + str((int(s)-7)%2 + 1) , "w+")
-    f.write(pubkey)
+        underlay, _, port = node_addresses[int(s)]
+        entry = "Address=" + underlay + "\nPort =" + str(port) + "\n" + pubkey
+    writer.write(conf_path("hosts", node_name(int(s))), entry)
+    return entry
+
+
+# module settings that the command line and config files may change
+settings = [
+    "servers", "clients", "need_start_sh", "conf_root", "incremental",
+    "host_links", "tincd_old", "topology", "max_degree", "topology_seed",
+    "client_assignment", "server_weights", "underlay_pool", "overlay_pool",
+    "port_range", "keygen_workers", "key_backend", "key_bits",
+    "keystore_dir", "rotate_keys", "remote_server_host"
+]
+
+
+def parse_args(argv=None):
+    "Parse the command line into a dict holding only the given settings."
+    parser = argparse.ArgumentParser(
+        description="Generate tinc configuration trees for a test lab.",
+        argument_default=argparse.SUPPRESS)
+    parser.add_argument("-c", "--config", dest="config",
+                        help="JSON file with the settings of one lab, "
+                             "or a list of labs to generate in turn")
+    parser.add_argument("-s", "--servers", dest="servers", type=int)
+    parser.add_argument("-n", "--clients", dest="clients", type=int)
+    parser.add_argument("-o", "--root", dest="conf_root",
+                        help="output directory, may use {servers} and {clients}")
+    parser.add_argument("--no-start-sh", dest="need_start_sh", action="store_false")
+    parser.add_argument("--remote-server-host", dest="remote_server_host",
+                        type=read_text, metavar="FILE",
+                        help="host entry of the remote server used without servers")
+    parser.add_argument("-i", "--incremental", dest="incremental", action="store_true",
+                        help="keep the tree and only rewrite changed files")
+    parser.add_argument("--links", dest="host_links", choices=["hard", "symlink", "copy"])
+    parser.add_argument("--tincd-old", dest="tincd_old", metavar="PATH")
+    parser.add_argument("-t", "--topology", dest="topology", choices=sorted(topologies))
+    parser.add_argument("-d", "--max-degree", dest="max_degree", type=int)
+    parser.add_argument("--seed", dest="topology_seed", type=int)
+    parser.add_argument("-a", "--assignment", dest="client_assignment",
+                        choices=sorted(client_assignments))
+    parser.add_argument("-w", "--weight", dest="server_weights", type=parse_weight,
+                        action="append", metavar="SERVER=WEIGHT")
+    parser.add_argument("--underlay", dest="underlay_pool", metavar="CIDR")
+    parser.add_argument("--overlay", dest="overlay_pool", metavar="CIDR")
+    parser.add_argument("--ports", dest="port_range", type=parse_range, metavar="FIRST-LAST")
+    parser.add_argument("-j", "--jobs", dest="keygen_workers", type=int,
+                        help="key generation workers, 0 for one per CPU")
+    parser.add_argument("-k", "--key-backend", dest="key_backend",
+                        choices=["auto"] + sorted(key_backends))
+    parser.add_argument("--key-bits", dest="key_bits", type=int)
+    parser.add_argument("--keystore", dest="keystore_dir", metavar="DIR")
+    parser.add_argument("--rotate-keys", dest="rotate_keys", nargs="*", metavar="NAME",
+                        help="regenerate the keys of the named nodes, or of all nodes")
+    args = vars(parser.parse_args(argv))
+    if "server_weights" in args:
+        args["server_weights"] = dict(args["server_weights"])
+    if args.get("rotate_keys") == []:
+        args["rotate_keys"] = True
+    return args
+
+
+def read_text(path):
+    f = open(path, "r")
+    text = f.read()
     f.close()
+    return text
+
+
+def parse_weight(text):
+    server, weight = text.split("=")
+    return int(server), float(weight)
+
+
+def parse_range(text):
+    first, last = text.split("-")
+    return int(first), int(last)
+
+
+def load_config(path):
+    "Return the list of labs described by a JSON config file."
+    labs = json.loads(read_text(path))
+    if isinstance(labs, dict):
+        labs = [labs]
+    for lab in labs:
+        for name in lab:
+            if name not in settings:
+                raise ValueError("%s: unknown setting %s" % (path, name))
+        if "server_weights" in lab:
+            lab["server_weights"] = dict((int(k), v) for k, v in lab["server_weights"].items())
+        if "port_range" in lab:
+            lab["port_range"] = tuple(lab["port_range"])
+    return labs
+
+
+def configure(values):
+    "Set the module settings from values."
+    module = globals()
+    for name in values:
+        module[name] = values[name]
+    module["conf_root"] = conf_root.format(servers=servers, clients=clients)
+
+
+def build_lab():
+    "Generate the configuration tree of the configured lab."
+    print("lab: %d servers, %d clients in %s" % (servers, clients, conf_root))
+    if not incremental:
+        clean_conf_dir()
+    return creat_conf()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    labs = [{}]
+    if "config" in args:
+        labs = load_config(args.pop("config"))
+    defaults = dict((name, globals()[name]) for name in settings)
+    for lab in labs:
+        values = dict(defaults)
+        values.update(lab)
+        values.update(args)
+        configure(values)
+        build_lab()
 
 
 if __name__ == '__main__':
-    clean_conf_dir()
-    creat_conf()
+    main()